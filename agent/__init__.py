@@ -1,18 +1,58 @@
 from smolagents import LiteLLMModel, InferenceClientModel
+from agent.prompt_cache import StreamUsageTracker
 from dotenv import load_dotenv
+from services.metrics import instrument_method
 import os
 
 load_dotenv()
 
-model: LiteLLMModel | InferenceClientModel
+# One model instance is shared by all agents, so all of them reuse the same connections to the model endpoint.
+# It is None if MODEL_PROVIDER is not set, then agents must be given a model explicitly (e.g. in benchmarks).
+model: LiteLLMModel | InferenceClientModel | None = None
 
 model_provider = os.getenv("MODEL_PROVIDER")
 
+# Ranking of find_emails results, see `RANKINGS` in models/email_list.py.
+search_ranking = os.getenv("SEARCH_RANKING", "count")
+
+# Outputs of tools of the protected agent are signed, the signature is put into their boundary tags.
+sign_tool_outputs = os.getenv("A2AS_SIGN_TOOL_OUTPUTS", "false").lower() == "true"
+
+# Maximum number of connections to the model endpoint, should be not less than number of agents working at once.
+model_http_pool_size = int(os.getenv("MODEL_HTTP_POOL_SIZE", "16"))
+
 if model_provider == 'local':
+    import httpx
+    import litellm
+
+    # LiteLLM creates HTTP clients on its own, giving it a pooled client keeps connections alive between requests.
+    litellm.client_session = httpx.Client(
+        limits=httpx.Limits(max_connections=model_http_pool_size, max_keepalive_connections=model_http_pool_size),
+    )
+
+    # llama.cpp server reuses KV cache of the common prompt prefix only if it is asked to,
+    # vLLM and other servers with automatic prefix caching don't need this flag.
+    model_kwargs = {}
+    if os.getenv("LOCAL_MODEL_CACHE_PROMPT", "true").lower() == "true":
+        model_kwargs["extra_body"] = {"cache_prompt": True}
+
     model_id = os.getenv("LOCAL_MODEL_ID")
     api_base = os.getenv("LOCAL_API_URL")
-    model = LiteLLMModel(model_id=model_id, api_base=api_base, api_key="not-needed")
+    model = LiteLLMModel(model_id=model_id, api_base=api_base, api_key="not-needed", **model_kwargs)
 elif model_provider == 'huggingface':
+    # Text Generation Inference caches common prompt prefixes on its own.
     token = os.getenv("HUGGING_FACE_TOKEN")
     model_id = os.getenv("HUGGING_FACE_MODEL_ID")
-    model = InferenceClientModel(model_id=model_id, token=token)
\ No newline at end of file
+    model = InferenceClientModel(model_id=model_id, token=token)
+
+# Usage of streamed responses, which smolagents doesn't keep in the output messages of steps.
+stream_usage = StreamUsageTracker()
+if model_provider == 'local':
+    stream_usage.instrument(model, "completion")
+elif model_provider == 'huggingface':
+    stream_usage.instrument(model, "chat_completion")
+
+if model_provider in ('local', 'huggingface'):
+    # Model calls of all agents are timed, if metrics are enabled.
+    instrument_method(model, "generate", "model_call")
+    instrument_method(model, "generate_stream", "model_call", generator=True)
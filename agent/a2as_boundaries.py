@@ -2,17 +2,41 @@
 A2AS Security Boundaries (S principle)
 Wraps external inputs in special tags to isolate untrusted content
 """
+from services.authenticator import TAG_SIGNATURE_LENGTH
+from services.metrics import metrics
+from typing import Tuple
+import re
 
 
-def wrap_tool_output(tool_name: str, output: str) -> str:
+# Output of a tool wrapped by `wrap_tool_output`, the tag is the same in both boundaries.
+WRAPPED_TOOL_OUTPUT_PATTERN = re.compile(
+    r"\[TOOL EXECUTED: (?P<name>[^\]\n]*)\]\n<(?P<tag>a2as:tool:(?P=name)(?::(?P<signature>\w+))?)>\n"
+    r"(?P<output>.*)\n</(?P=tag)>\n\[END OF TOOL OUTPUT\]",
+    re.DOTALL,
+)
+
+
+def wrap_tool_output(tool_name: str, output: str, signature: str = None) -> str:
     """
-    Wrap tool output in security boundaries
+    Wrap tool output in security boundaries with optional authentication
 
     S - Security Boundaries: Isolate untrusted tool responses
+    A - Authenticated Prompts: Include integrity hash, so the closing tag can't be forged inside the output
     """
-    return f"[TOOL EXECUTED: {tool_name}]\n<a2as:tool:{tool_name}>\n{output}\n</a2as:tool:{tool_name}>\n[END OF TOOL OUTPUT]"
+    # A single f-string copies the output only once.
+    tag = f"a2as:tool:{tool_name}:{signature[:TAG_SIGNATURE_LENGTH]}" if signature else f"a2as:tool:{tool_name}"
+    return f"[TOOL EXECUTED: {tool_name}]\n<{tag}>\n{output}\n</{tag}>\n[END OF TOOL OUTPUT]"
+
+
+def unwrap_tool_output(wrapped: str) -> Tuple[str, str | None]:
+    """Output of the tool without security boundaries and the signature from its tags, the text as is if it isn't wrapped"""
+    match = WRAPPED_TOOL_OUTPUT_PATTERN.fullmatch(wrapped)
+    if match is None:
+        return wrapped, None
+    return match["output"], match["signature"]
 
 
+@metrics.timed("wrap_user_input")
 def wrap_user_input(user_message: str, signature: str = None) -> str:
     """
     Wrap user input in security boundaries with optional authentication
@@ -24,4 +48,4 @@ def wrap_user_input(user_message: str, signature: str = None) -> str:
         # Include first 8 chars of signature for authentication
         return f"<a2as:user:{signature[:8]}>\n{user_message}\n</a2as:user:{signature[:8]}>"
     else:
-        return f"<a2as:user>\n{user_message}\n</a2as:user>"
\ No newline at end of file
+        return f"<a2as:user>\n{user_message}\n</a2as:user>"
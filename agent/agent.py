@@ -1,20 +1,35 @@
-from smolagents import ToolCallingAgent
+from smolagents import AgentLogger, Model, ToolCallingAgent
 
 from models.behavior_certificates import DummyEmailBehaviorCertificates
 from models.email_agent_tools import EmailRegistry, FindEmailsTool, SendEmailTool
-from . import model
+from . import model as default_model, search_ranking
 
 
-def get_agent(user_addr: str, email_registry: EmailRegistry):
+def get_tools(user_addr: str, email_registry: EmailRegistry) -> list:
+    """Tools of the unprotected agent"""
     behavior_certificates = DummyEmailBehaviorCertificates()
 
+    return [
+        # For unprotected email agent we use DummyEmailBehaviorCertificates.
+        FindEmailsTool(user_addr, email_registry, behavior_certificates, ranking=search_ranking),
+        SendEmailTool(user_addr, email_registry, behavior_certificates),
+    ]
+
+
+def get_agent(
+        user_addr: str,
+        email_registry: EmailRegistry,
+        logger: AgentLogger | None = None,
+        stream_outputs: bool = False,
+        step_callbacks: list | None = None,
+        model: Model | None = None,
+):
     return ToolCallingAgent(
         name='mailbox_agent',
-        tools = [
-            # For unprotected email agent we use DummyEmailBehaviorCertificates.
-            FindEmailsTool(user_addr, email_registry, behavior_certificates),
-            SendEmailTool(user_addr, email_registry, behavior_certificates),
-        ],
-        model=model,
+        tools=get_tools(user_addr, email_registry),
+        model=model or default_model,
         max_steps=5,
+        stream_outputs=stream_outputs,
+        step_callbacks=step_callbacks,
+        logger=logger,
     )
@@ -0,0 +1,197 @@
+"""
+Structured events of agent runs.
+
+Every agent step is turned into typed records (a model call and its tool calls, with durations and tokens),
+which are kept in a bounded ring buffer of the chat session and optionally appended to a JSONL file.
+Events are recorded by a step callback, so nothing depends on parsing the console output.
+Tool calls are timed by `time_tool_calls`, the model call of a step lasts from the start of the step to its first tool call.
+"""
+from collections import deque
+from smolagents import ToolCallingAgent
+from smolagents.memory import ActionStep
+from typing import Any, Dict, List, Tuple
+import functools
+import json
+import threading
+import time
+
+
+class AgentEvent:
+    """Single record of an agent run: "model_call", "tool_call" or "final_answer" """
+
+    __slots__ = (
+        "kind",
+        "session_id",
+        "step_number",
+        "timestamp",
+        "duration",
+        "input_tokens",
+        "output_tokens",
+        "tool_name",
+        "tool_arguments",
+        "error",
+    )
+
+    def __init__(
+            self,
+            kind: str,
+            session_id: str,
+            step_number: int,
+            timestamp: float,
+            duration: float | None = None,
+            input_tokens: int | None = None,
+            output_tokens: int | None = None,
+            tool_name: str | None = None,
+            tool_arguments: Any = None,
+            error: str | None = None,
+    ):
+        self.kind = kind
+        self.session_id = session_id
+        self.step_number = step_number
+        self.timestamp = timestamp
+        self.duration = duration
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.tool_name = tool_name
+        self.tool_arguments = tool_arguments
+        self.error = error
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.__slots__ if getattr(self, field) is not None}
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{field}={value!r}" for field, value in self.to_dict().items())
+        return f"AgentEvent({fields})"
+
+
+class JsonlEventSink:
+    """Appends events as JSON lines to a file shared by all sessions"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, events: List[AgentEvent]):
+        lines = "".join(json.dumps(event.to_dict(), default=str) + "\n" for event in events)
+        with self._lock:
+            self._file.write(lines)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class AgentEventLog:
+    """Ring buffer with the last max_events events of a chat session"""
+
+    def __init__(self, session_id: str, max_events: int = 1000, sink: JsonlEventSink | None = None):
+        self.session_id = session_id
+        self.events = deque(maxlen=max_events)
+        self.sink = sink
+        self._lock = threading.Lock()
+
+    def record(self, events: List[AgentEvent]):
+        with self._lock:
+            self.events.extend(events)
+        if self.sink is not None:
+            self.sink.write(events)
+
+    def snapshot(self) -> List[AgentEvent]:
+        with self._lock:
+            return list(self.events)
+
+    def clear(self):
+        with self._lock:
+            self.events.clear()
+
+
+# (tool name, arguments, start time, duration) of a tool call.
+ToolTiming = Tuple[str, Any, float, float]
+
+
+def time_tool_calls(agent: ToolCallingAgent):
+    """Record timings of tool calls of the agent into its `tool_timings`, they are taken by `record_step_events`"""
+    execute_tool_call = agent.execute_tool_call
+    agent.tool_timings = []
+
+    @functools.wraps(execute_tool_call)
+    def wrapper(tool_name: str, arguments: Any) -> Any:
+        start_time = time.time()
+        started_at = time.perf_counter()
+        try:
+            return execute_tool_call(tool_name, arguments)
+        finally:
+            # Parallel tool calls of a step run in threads, appending to a list is atomic.
+            agent.tool_timings.append((tool_name, arguments, start_time, time.perf_counter() - started_at))
+
+    agent.execute_tool_call = wrapper
+
+
+def step_events(
+        memory_step: ActionStep,
+        session_id: str,
+        tool_timings: List[ToolTiming] | None = None,
+        model_call: bool = True,
+) -> List[AgentEvent]:
+    """
+    Events of a finished agent step
+
+    The model call lasts until the first of tool_timings (or the end of the step, if tools were not timed).
+    Steps without the model (e.g. requests served by the fast path) are recorded with model_call=False.
+    """
+    timing = memory_step.timing
+    timestamp = timing.start_time if timing is not None else time.time()
+    token_usage = memory_step.token_usage
+    error = str(memory_step.error) if memory_step.error is not None else None
+    tool_timings = list(tool_timings or [])
+
+    events = []
+    if model_call:
+        duration = timing.duration if timing is not None else None
+        if tool_timings and timing is not None:
+            duration = min(start_time for _, _, start_time, _ in tool_timings) - timing.start_time
+        events.append(AgentEvent(
+            "model_call",
+            session_id,
+            memory_step.step_number,
+            timestamp,
+            duration=duration,
+            input_tokens=token_usage.input_tokens if token_usage is not None else None,
+            output_tokens=token_usage.output_tokens if token_usage is not None else None,
+            error=error,
+        ))
+
+    for tool_call in memory_step.tool_calls or []:
+        # Tool calls are matched with their timings by name and arguments, parallel calls finish in any order.
+        arguments = tool_call.arguments or {}
+        tool_timing = next((item for item in tool_timings if item[0] == tool_call.name and item[1] == arguments), None)
+        if tool_timing is not None:
+            tool_timings.remove(tool_timing)
+        events.append(AgentEvent(
+            "final_answer" if tool_call.name == "final_answer" else "tool_call",
+            session_id,
+            memory_step.step_number,
+            tool_timing[2] if tool_timing is not None else timestamp,
+            duration=tool_timing[3] if tool_timing is not None else None,
+            tool_name=tool_call.name,
+            tool_arguments=tool_call.arguments,
+        ))
+    return events
+
+
+def record_step_events(memory_step, agent=None):
+    """
+    Step callback, which records events into the event log attached to the agent
+
+    Agents are shared between sessions, `AgentPool` attaches the event log of the session on checkout
+    and times tool calls of its agents.
+    """
+    event_log: AgentEventLog | None = getattr(agent, "event_log", None)
+    if event_log is None or not isinstance(memory_step, ActionStep):
+        return
+    tool_timings = getattr(agent, "tool_timings", None)
+    event_log.record(step_events(memory_step, event_log.session_id, tool_timings))
+    if tool_timings is not None:
+        tool_timings.clear()
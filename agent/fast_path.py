@@ -0,0 +1,147 @@
+"""
+Deterministic fast path for unambiguous requests.
+
+Requests like "show all emails" or `send email to X with subject "Y" and body "Z"` name the tool and all of its
+arguments, so they are recognized by compiled patterns and executed by the agent's tools directly,
+without the model. The tools still check behavior certificates and wrap their output for A2AS,
+everything which doesn't match exactly goes to the agent as before.
+The wrapped output is kept in the conversation memory for the agent, the user sees it without boundaries
+and without the instructions meant for the model. Signed outputs are verified before they are shown.
+"""
+from agent.a2as_boundaries import unwrap_tool_output
+from agent.events import AgentEventLog, step_events
+from models.email_agent_tools import strip_model_instructions
+from services.authenticator import verify_tool_output
+from services.metrics import metrics
+from smolagents import Tool
+from smolagents.memory import ActionStep, MemoryStep, TaskStep, ToolCall
+from smolagents.monitoring import Timing
+from typing import Any, Dict, List, Mapping, Tuple
+import re
+import threading
+import time
+
+
+# (tool name, arguments) of a recognized request.
+Route = Tuple[str, Dict[str, Any]]
+
+SHOW_ALL_PATTERN = re.compile(
+    r"(?:please\s+)?(?:show|list|display|get)\s+(?:me\s+)?all\s+(?:of\s+)?(?:my\s+)?(?:e-?mails|mails|messages)"
+    r"(?:\s+please)?\s*[.!]?",
+    re.IGNORECASE,
+)
+
+# Subject and body must be quoted, otherwise " and body " inside the subject would make the request ambiguous.
+# Quoted text can't contain its own quote character, so requests with stray quotes (like two bodies) go to the model.
+SEND_EMAIL_PATTERN = re.compile(
+    r"(?:please\s+)?send\s+(?:an?\s+)?(?:e-?mail|mail|message)\s+to\s+(?P<to>[\w.+-]+@[\w-]+(?:\.[\w-]+)+)\s+"
+    r"with\s+(?:the\s+)?subject\s+(?P<subject_quote>[\"'])(?P<subject>(?:(?!(?P=subject_quote)).)*)(?P=subject_quote)\s+"
+    r"and\s+(?:the\s+)?body\s+(?P<body_quote>[\"'])(?P<body>(?:(?!(?P=body_quote)).)*)(?P=body_quote)\s*[.!]?",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def match_request(message: str) -> Route | None:
+    """Tool call, which the message asks for, or None if the message needs the model"""
+    message = message.strip()
+    if SHOW_ALL_PATTERN.fullmatch(message):
+        return "find_emails", {"query": "all emails"}
+
+    match = SEND_EMAIL_PATTERN.fullmatch(message)
+    if match:
+        return "send_email", {"to_address": match["to"], "subject": match["subject"], "body": match["body"]}
+
+    return None
+
+
+def display_output(tool_name: str, output: str) -> str:
+    """Output of a tool as it is shown to the user"""
+    output, signature = unwrap_tool_output(output)
+    if signature is not None and not verify_tool_output(tool_name, output, signature):
+        raise ValueError(f"Integrity check failed: output of {tool_name} has been tampered")
+    return strip_model_instructions(output)
+
+
+class FastPathStats:
+    """Hit rate of the fast path and time it saves compared to requests served by the agent"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.fast_path_seconds = 0.0
+        self.agent_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record_hit(self, duration: float):
+        with self._lock:
+            self.hits += 1
+            self.fast_path_seconds += duration
+        metrics.observe("agent_stage_seconds", duration, stage="fast_path")
+
+    def record_miss(self, duration: float):
+        """Duration of a request, which was not recognized and was served by the agent"""
+        with self._lock:
+            self.misses += 1
+            self.agent_seconds += duration
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            requests = self.hits + self.misses
+            fast_path_avg = self.fast_path_seconds / self.hits if self.hits else 0.0
+            agent_avg = self.agent_seconds / self.misses if self.misses else 0.0
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / requests if requests else 0.0,
+                "fast_path_avg_ms": 1000 * fast_path_avg,
+                "agent_avg_ms": 1000 * agent_avg,
+                # Estimated with the average latency of the agent, as if it had served the recognized requests.
+                "saved_seconds": self.hits * max(agent_avg - fast_path_avg, 0.0) if self.misses else 0.0,
+            }
+
+
+class FastPathRouter:
+    """Executes recognized requests with the given tools and records them in the conversation memory"""
+
+    def __init__(self, stats: FastPathStats | None = None):
+        self.stats = stats or FastPathStats()
+
+    def run(
+            self,
+            message: str,
+            task: str,
+            tools: Mapping[str, Tool],
+            memory_steps: List[MemoryStep],
+            event_log: AgentEventLog | None = None,
+    ) -> str | None:
+        """
+        Output of the tool for the user (see `display_output`), if the message is recognized, otherwise None
+
+        The task (message as it would be given to the agent) and the tool call with its output as the model
+        would get it are appended to memory_steps the same way the agent records them,
+        so the agent sees them in the following requests of the conversation.
+        """
+        route = match_request(message)
+        if route is None:
+            return None
+
+        name, arguments = route
+        started_at = time.perf_counter()
+        start_time = time.time()
+        output = tools[name](**arguments)
+        tool_timing = (name, arguments, start_time, time.perf_counter() - started_at)
+
+        step = ActionStep(
+            step_number=1,
+            timing=Timing(start_time=start_time, end_time=time.time()),
+            tool_calls=[ToolCall(name=name, arguments=arguments, id="fast_path")],
+            observations=output,
+            action_output=output,
+        )
+        memory_steps.extend([TaskStep(task=task), step])
+        if event_log is not None:
+            # The model is not called, only the tool call is recorded.
+            event_log.record(step_events(step, event_log.session_id, [tool_timing], model_call=False))
+
+        self.stats.record_hit(time.perf_counter() - started_at)
+        return display_output(name, output)
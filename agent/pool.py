@@ -0,0 +1,78 @@
+"""
+Pool of pre-built agents.
+
+Agents are built once on startup and are checked out for a single request.
+Conversation memory belongs to the chat session, it is attached to the agent on checkout
+and detached on check in, so resetting the conversation is just replacing the list of steps.
+"""
+from collections import deque
+from contextlib import contextmanager
+from agent.events import AgentEventLog, time_tool_calls
+from smolagents import AgentLogger, ToolCallingAgent
+from smolagents.memory import MemoryStep
+from typing import Callable, Dict, Iterator, List
+import queue
+import threading
+import time
+
+
+class AgentPool:
+    """Fixed-size pool of agents of the same kind"""
+
+    def __init__(self, create_agent: Callable[[], ToolCallingAgent], size: int, wait_times_window: int = 1000):
+        self.size = size
+        # LIFO order keeps recently used agents in use, while others stay idle.
+        self._idle_agents = queue.LifoQueue()
+        for _ in range(size):
+            agent = create_agent()
+            time_tool_calls(agent)
+            self._idle_agents.put(agent)
+
+        # Time (in seconds) which requests waited for a free agent.
+        self._wait_times = deque(maxlen=wait_times_window)
+        self._checkouts = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def checkout(
+            self,
+            memory_steps: List[MemoryStep],
+            logger: AgentLogger,
+            event_log: AgentEventLog | None = None,
+    ) -> Iterator[ToolCallingAgent]:
+        """Take a free agent and attach conversation memory, logger and event log of the session to it"""
+        started_at = time.perf_counter()
+        agent = self._idle_agents.get()
+        with self._lock:
+            self._wait_times.append(time.perf_counter() - started_at)
+            self._checkouts += 1
+
+        agent.memory.steps = memory_steps
+        agent.logger = agent.monitor.logger = logger
+        agent.monitor.reset()
+        # Read by `record_step_events` step callback.
+        agent.event_log = event_log
+        try:
+            yield agent
+        finally:
+            agent.memory.steps = []
+            agent.event_log = None
+            agent.tool_timings.clear()
+            self._idle_agents.put(agent)
+
+    def stats(self) -> Dict[str, float]:
+        """Statistics of waiting for a free agent, in milliseconds"""
+        with self._lock:
+            wait_times = sorted(self._wait_times)
+            checkouts = self._checkouts
+
+        def percentile(q: float) -> float:
+            return 1000 * wait_times[int(q * (len(wait_times) - 1))] if wait_times else 0.0
+
+        return {
+            "checkouts": checkouts,
+            "idle": self._idle_agents.qsize(),
+            "wait_avg_ms": 1000 * sum(wait_times) / len(wait_times) if wait_times else 0.0,
+            "wait_p95_ms": percentile(0.95),
+            "wait_max_ms": percentile(1.0),
+        }
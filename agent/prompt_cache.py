@@ -0,0 +1,163 @@
+"""
+Prompt caching instrumentation.
+
+The system prompt (with A2AS instructions) and the previous steps of the conversation are resent
+to the model on every step. Model servers with prefix caching (llama.cpp, vLLM, TGI) don't recompute
+the prefix they have already seen, and report how many prompt tokens were taken from the cache.
+This module collects these numbers per agent step.
+
+When responses are streamed, smolagents builds the output message of a step from deltas, which carry only
+token counts, so `raw` of the message is None. `StreamUsageTracker` keeps the usage of the final streamed chunk instead.
+"""
+from collections import OrderedDict, deque
+from smolagents import LogLevel
+from smolagents.memory import ActionStep
+from typing import Any, Dict, List
+import functools
+import threading
+import types
+
+
+def _get(data: Any, key: str) -> Any:
+    """Get field from dict or object, raw responses of different providers come in both forms"""
+    if data is None:
+        return None
+    if isinstance(data, dict):
+        return data.get(key)
+    return getattr(data, key, None)
+
+
+def cached_prompt_tokens(raw_response: Any) -> int | None:
+    """Number of prompt tokens served from the cache, None if the server did not report it"""
+    # OpenAI-compatible servers (vLLM, LiteLLM proxies, recent llama.cpp).
+    cached_tokens = _get(_get(_get(raw_response, "usage"), "prompt_tokens_details"), "cached_tokens")
+    if cached_tokens is not None:
+        return cached_tokens
+
+    # llama.cpp server reports cache hits in its timings.
+    return _get(_get(raw_response, "timings"), "cache_n")
+
+
+class _ClientProxy:
+    """Client, whose methods can be replaced without touching the wrapped module (LiteLLM models use the litellm module)"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class StreamUsageTracker:
+    """
+    Usage chunks of streamed responses, kept by input messages of the step until the step callback takes them
+
+    The streaming method of the model's client is wrapped to catch the chunk with usage,
+    and `generate_stream` of the model to know which step (input messages) the chunk belongs to.
+    Agents may be resumed by different threads between deltas, so the chunk is passed through a thread local
+    only within one resumption of `generate_stream`.
+    """
+
+    def __init__(self, size: int = 1000):
+        # id of input messages -> (input messages, last chunk with usage), bounded for steps which never reach callbacks.
+        self._usage = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.size = size
+
+    def instrument(self, model, client_method: str):
+        """Track streamed responses of the model, client_method is the streaming method of `model.client`"""
+        client = model.client
+        if isinstance(client, types.ModuleType):
+            client = model.client = _ClientProxy(client)
+        setattr(client, client_method, self._track_client(getattr(client, client_method)))
+        model.generate_stream = self._track_generate_stream(model.generate_stream)
+
+    def _track_client(self, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            response = method(*args, **kwargs)
+            return self._track_chunks(response) if kwargs.get("stream") else response
+        return wrapper
+
+    def _track_chunks(self, chunks):
+        for chunk in chunks:
+            if _get(chunk, "usage") is not None or _get(chunk, "timings") is not None:
+                sink = getattr(self._local, "sink", None)
+                if sink is not None:
+                    sink.append(chunk)
+            yield chunk
+
+    def _track_generate_stream(self, generate_stream):
+        @functools.wraps(generate_stream)
+        def wrapper(messages, *args, **kwargs):
+            deltas = generate_stream(messages, *args, **kwargs)
+            sink: List[Any] = []
+            while True:
+                self._local.sink = sink
+                try:
+                    delta = next(deltas)
+                except StopIteration:
+                    break
+                finally:
+                    self._local.sink = None
+                yield delta
+            if sink:
+                with self._lock:
+                    self._usage[id(messages)] = (messages, sink[-1])
+                    while len(self._usage) > self.size:
+                        self._usage.popitem(last=False)
+        return wrapper
+
+    def pop(self, messages) -> Any:
+        """Last usage chunk of the response streamed for the input messages, None if there was none"""
+        with self._lock:
+            entry = self._usage.pop(id(messages), None)
+        if entry is None or entry[0] is not messages:
+            return None
+        return entry[1]
+
+
+class PromptCacheStats:
+    """Step callback which records cached and uncached prompt tokens of every agent step"""
+
+    def __init__(self, window: int = 1000, stream_usage: StreamUsageTracker | None = None):
+        # (prompt tokens, cached prompt tokens or None) of recent steps.
+        self.steps = deque(maxlen=window)
+        self.stream_usage = stream_usage
+        self._lock = threading.Lock()
+
+    def __call__(self, memory_step, agent=None):
+        if not isinstance(memory_step, ActionStep) or memory_step.token_usage is None:
+            return
+
+        prompt_tokens = memory_step.token_usage.input_tokens
+        message = memory_step.model_output_message
+        raw_response = message.raw if message is not None else None
+        if raw_response is None and self.stream_usage is not None:
+            raw_response = self.stream_usage.pop(memory_step.model_input_messages)
+        cached_tokens = cached_prompt_tokens(raw_response)
+        with self._lock:
+            self.steps.append((prompt_tokens, cached_tokens))
+
+        if agent is not None:
+            if cached_tokens is None:
+                report = f"Prompt tokens: {prompt_tokens} (cache usage was not reported by the model server)"
+            else:
+                report = f"Prompt tokens: {prompt_tokens}, cached: {cached_tokens}, uncached: {prompt_tokens - cached_tokens}"
+            agent.logger.log(report, level=LogLevel.INFO)
+
+    def summary(self) -> Dict[str, float]:
+        """Totals over recent steps, which reported cache usage"""
+        with self._lock:
+            reported = [(prompt, cached) for prompt, cached in self.steps if cached is not None]
+
+        prompt_tokens = sum(prompt for prompt, _ in reported)
+        cached_tokens = sum(cached for _, cached in reported)
+        return {
+            "steps": len(reported),
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "uncached_tokens": prompt_tokens - cached_tokens,
+            "cache_hit_ratio": cached_tokens / prompt_tokens if prompt_tokens else 0.0,
+        }
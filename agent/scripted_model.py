@@ -0,0 +1,74 @@
+"""
+Deterministic stand-in for the LLM.
+
+`ScriptedModel` answers every step of an agent with the next tool call of a script,
+after a configurable delay, so agents, tools and A2AS wrapping can be exercised and benchmarked
+without a model server or network access.
+"""
+from smolagents import Model
+from smolagents.models import ChatMessage, ChatMessageToolCall, ChatMessageToolCallFunction, MessageRole
+from smolagents.monitoring import TokenUsage
+from typing import Any, Dict, List, Sequence, Tuple
+import json
+import time
+
+
+# (tool name, arguments) called by the model at one step.
+ScriptedCall = Tuple[str, Dict[str, Any]]
+
+
+def _message_text(message) -> str:
+    content = message.content if isinstance(message, ChatMessage) else message.get("content")
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def _message_role(message) -> str:
+    role = message.role if isinstance(message, ChatMessage) else message.get("role")
+    return role.value if isinstance(role, MessageRole) else str(role)
+
+
+class ScriptedModel(Model):
+    """
+    Model, which calls tools from the script one by one during every run of the agent
+
+    The step of the run is the number of tool responses after the last user message,
+    when the script is over, the model gives the final answer. Token usage is estimated as 4 characters per token.
+    """
+
+    def __init__(self, script: Sequence[ScriptedCall], latency: float = 0.0, final_answer: str = "Done"):
+        super().__init__(model_id="scripted")
+        self.script: List[ScriptedCall] = list(script)
+        self.latency = latency
+        self.final_answer = final_answer
+
+    def generate(self, messages, stop_sequences=None, response_format=None, tools_to_call_from=None, **kwargs) -> ChatMessage:
+        step = 0
+        for message in reversed(messages):
+            role = _message_role(message)
+            if role == MessageRole.USER.value:
+                break
+            if role == MessageRole.TOOL_RESPONSE.value:
+                step += 1
+
+        if step < len(self.script):
+            name, arguments = self.script[step]
+        else:
+            name, arguments = "final_answer", {"answer": self.final_answer}
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        input_chars = sum(len(_message_text(message)) for message in messages)
+        output_chars = len(name) + len(json.dumps(arguments))
+        return ChatMessage(
+            role=MessageRole.ASSISTANT,
+            content="",
+            tool_calls=[ChatMessageToolCall(
+                function=ChatMessageToolCallFunction(name=name, arguments=arguments),
+                id=f"call_{step}",
+                type="function",
+            )],
+            token_usage=TokenUsage(input_tokens=input_chars // 4, output_tokens=output_chars // 4),
+        )
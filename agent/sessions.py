@@ -0,0 +1,55 @@
+"""
+Chat sessions of the agent.
+
+Every browser session has its own conversation memory (so it is not shared between users)
+its own bounded log buffer, which is filled through the agents' logger instead of redirecting `sys.stdout`,
+and its own log of structured events, which is filled by the agents' step callback.
+Agents themselves are taken from `AgentPool` for the time of a request.
+"""
+from agent.events import AgentEventLog
+from smolagents import AgentLogger
+from smolagents.memory import MemoryStep
+from typing import Callable, Dict, List
+import threading
+
+from ui.loggers import GradioConsoleLogger
+
+
+class AgentSession:
+    """Conversation memory and logs of a single chat session"""
+
+    def __init__(self, console_logger: GradioConsoleLogger, agent_logger: AgentLogger, event_log: AgentEventLog | None = None):
+        self.console_logger = console_logger
+        self.agent_logger = agent_logger
+        self.event_log = event_log
+        self.agent_memory: List[MemoryStep] = []
+        self.agent_with_a2as_memory: List[MemoryStep] = []
+        # Requests of the same session are processed one by one.
+        self.lock = threading.Lock()
+
+    def reset_memory(self):
+        self.agent_memory = []
+        self.agent_with_a2as_memory = []
+
+    def clear_logs(self):
+        self.console_logger.clear()
+
+
+class AgentSessionPool:
+    """Creates agent sessions on demand and keeps them by session id"""
+
+    def __init__(self, create_session: Callable[[str], AgentSession]):
+        self.create_session = create_session
+        self.sessions: Dict[str, AgentSession] = {}
+        self.lock = threading.Lock()
+
+    def get(self, session_id: str) -> AgentSession:
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = self.sessions[session_id] = self.create_session(session_id)
+            return session
+
+    def close(self, session_id: str):
+        with self.lock:
+            self.sessions.pop(session_id, None)
@@ -0,0 +1,70 @@
+"""
+Throughput of signing and A2AS wrapping of prompts and tool outputs of different sizes.
+
+Compares the current signing (keyed HMAC state copied per message, chunked encoding)
+with the straightforward implementation it replaced, which created the HMAC from the secret on every call.
+
+Run from the root of repository:
+    python -m benchmarks.a2as_signing --sizes 1000 100000 10000000
+"""
+import os
+
+# Any secret works for the benchmark.
+os.environ.setdefault("PROMPT_SIGN_SECRET", "benchmark-secret")
+
+from agent.a2as_boundaries import wrap_tool_output, wrap_user_input
+from services.authenticator import PROMPT_SIGN_SECRET, sign_message, sign_tool_output, verify_sign
+import argparse
+import hashlib
+import hmac
+import time
+
+
+def naive_sign(prompt: str) -> str:
+    """Signing as it was written before the keyed HMAC state"""
+    return hmac.new(PROMPT_SIGN_SECRET.encode(), prompt.encode(), hashlib.sha256).hexdigest()[:16]
+
+
+def sign_and_wrap_prompt(prompt: str) -> str:
+    """Path of a prompt to the protected agent in app.py"""
+    signature = sign_message(prompt)
+    if not verify_sign(prompt, signature):
+        raise ValueError("Integrity check failed")
+    return wrap_user_input(prompt, signature)
+
+
+def measure(run, size: int, min_seconds: float = 0.5) -> float:
+    """Bytes per second of the function processing a text of the given size"""
+    calls = 0
+    started_at = time.perf_counter()
+    while True:
+        run()
+        calls += 1
+        elapsed = time.perf_counter() - started_at
+        if elapsed >= min_seconds:
+            return calls * size / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1_000, 100_000, 10_000_000])
+    parser.add_argument("--seconds", type=float, default=0.5, help="minimal time of every measurement")
+    args = parser.parse_args()
+
+    cases = {
+        "sign prompt (naive)": lambda text: naive_sign(text),
+        "sign prompt": lambda text: sign_message(text),
+        "sign + verify + wrap prompt": sign_and_wrap_prompt,
+        "wrap tool output": lambda text: wrap_tool_output("find_emails", text),
+        "sign + wrap tool output": lambda text: wrap_tool_output("find_emails", text, sign_tool_output("find_emails", text)),
+    }
+
+    print(f"{'':>28} | " + " | ".join(f"{size:>11,} B" for size in args.sizes))
+    texts = {size: ("From: colleague@goodcorp.ai Subject: report " * (size // 44 + 1))[:size] for size in args.sizes}
+    for name, run in cases.items():
+        rates = [measure(lambda: run(texts[size]), size, args.seconds) for size in args.sizes]
+        print(f"{name:>28} | " + " | ".join(f"{rate / 2**20:>9,.1f} MB/s" for rate in rates))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+End-to-end benchmark of agents without a model server.
+
+Agents run against `ScriptedModel`, which searches the mailbox, sends an email and gives the final answer,
+over synthetic mailboxes of increasing size. For every mailbox size and agent kind it measures
+end-to-end latency of a request, time spent in tools, time of the search itself and memory of the mailbox.
+
+Run from the root of repository:
+    python -m benchmarks.agent_offline --sizes 1000 10000 100000 --requests 20 --latency 0.0
+"""
+import os
+
+# Prompts of the protected agent are signed, any secret works for the benchmark.
+os.environ.setdefault("PROMPT_SIGN_SECRET", "benchmark-secret")
+
+from agent.a2as_boundaries import wrap_user_input
+from agent.agent import get_agent
+from agent.agent_with_a2as import get_agent_with_a2as
+from agent.scripted_model import ScriptedModel
+from benchmarks.email_storage_memory import generate_emails
+from models.email_agent_tools import FIND_EMAILS_TOP_K, EmailRegistry
+from models.email_list import EmailList, RANKINGS, STORAGES
+from services.authenticator import sign_message
+from smolagents import AgentLogger, LogLevel
+import argparse
+import statistics
+import time
+import tracemalloc
+
+
+USER_EMAIL = "user@goodcorp.ai"
+HELEN_EMAIL = "helenjoy@goodcorp.ai"
+
+TASK = "Find emails about the budget report and send a short summary to Helen"
+SEARCH_QUERY = "budget report"
+SCRIPT = [
+    ("find_emails", {"query": SEARCH_QUERY}),
+    ("send_email", {"to_address": HELEN_EMAIL, "subject": "Budget report", "body": "Summary of the budget report emails"}),
+]
+
+
+def build_registry(size: int, storage: str):
+    """Registry with a synthetic mailbox of the user, returns it with memory taken by the mailbox in bytes"""
+    tracemalloc.start()
+    user_emails = EmailList(USER_EMAIL, storage=storage)
+    for email in generate_emails(size):
+        user_emails.add_received_email(email["from"], email["subject"], email["body"])
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    registry = EmailRegistry({USER_EMAIL: user_emails, HELEN_EMAIL: EmailList(HELEN_EMAIL, storage=storage)})
+    return registry, memory
+
+
+class ToolTimer:
+    """Wraps forward of the agent's tools and sums the time spent in them"""
+
+    def __init__(self, agent):
+        self.total = 0.0
+        for tool in agent.tools.values():
+            tool.forward = self._timed(tool.forward)
+
+    def _timed(self, forward):
+        def wrapper(*args, **kwargs):
+            started_at = time.perf_counter()
+            try:
+                return forward(*args, **kwargs)
+            finally:
+                self.total += time.perf_counter() - started_at
+
+        return wrapper
+
+
+def run_requests(agent, task_factory, requests: int):
+    """Latencies of requests and average time spent in tools, in seconds"""
+    tool_timer = ToolTimer(agent)
+    latencies = []
+    for _ in range(requests):
+        task = task_factory()
+        started_at = time.perf_counter()
+        agent.run(task, reset=True)
+        latencies.append(time.perf_counter() - started_at)
+    return latencies, tool_timer.total / requests
+
+
+def measure_search(email_list: EmailList, ranking: str, repeats: int = 20) -> float:
+    """Average time of the search with the benchmark query, the first (indexing) search is not counted"""
+    email_list.search_with_verdicts(SEARCH_QUERY, top_k=FIND_EMAILS_TOP_K, ranking=ranking)
+    started_at = time.perf_counter()
+    for _ in range(repeats):
+        email_list.search_with_verdicts(SEARCH_QUERY, top_k=FIND_EMAILS_TOP_K, ranking=ranking)
+    return (time.perf_counter() - started_at) / repeats
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--requests", type=int, default=20, help="requests per mailbox size and agent kind")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds, which the model spends on every step")
+    parser.add_argument("--storage", choices=STORAGES, default="list")
+    parser.add_argument("--ranking", choices=RANKINGS, default="count")
+    args = parser.parse_args()
+
+    model = ScriptedModel(SCRIPT, latency=args.latency)
+    logger = AgentLogger(level=LogLevel.OFF)
+
+    print(
+        f"{'emails':>8} | {'agent':>6} | {'mailbox':>9} | {'search':>9} | "
+        f"{'p50':>9} | {'p95':>9} | {'tools':>9} | {'overhead':>9}"
+    )
+    for size in args.sizes:
+        registry, memory = build_registry(size, args.storage)
+        search_time = measure_search(registry[USER_EMAIL], args.ranking)
+
+        agents = {
+            "plain": (get_agent(USER_EMAIL, registry, logger=logger, model=model), lambda: TASK),
+            "a2as": (
+                get_agent_with_a2as(USER_EMAIL, registry, logger=logger, model=model),
+                lambda: wrap_user_input(TASK, sign_message(TASK)),
+            ),
+        }
+        for name, (agent, task_factory) in agents.items():
+            # Agents take ranking of find_emails from SEARCH_RANKING env, the benchmark overrides it.
+            for tool in agent.tools.values():
+                if hasattr(tool, "ranking"):
+                    tool.ranking = args.ranking
+
+            latencies, tool_time = run_requests(agent, task_factory, args.requests)
+            p50 = percentile(latencies, 0.5)
+            # Time of the agent itself: latency without the model and the tools.
+            overhead = statistics.mean(latencies) - tool_time - args.latency * (len(SCRIPT) + 1)
+            print(
+                f"{size:>8} | {name:>6} | {memory / 2**20:>6.1f} MB | {search_time * 1000:>6.2f} ms | "
+                f"{p50 * 1000:>6.1f} ms | {percentile(latencies, 0.95) * 1000:>6.1f} ms | "
+                f"{tool_time * 1000:>6.2f} ms | {overhead * 1000:>6.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Memory footprint of email storage backends: list of dicts vs `CompactEmailStore`.
+
+Emails alone are measured first, then whole mailboxes (`EmailList` with its search indexes) after their first search,
+which is what a mailbox really costs. The BM25 index is built only by the first bm25 (or hybrid) search.
+Compact storage takes about 2x less memory for emails alone (about 730 -> 360 bytes per synthetic email),
+but indexes are the same for both storages, so at 100k emails a whole compact mailbox is only 1.2x smaller
+when it is searched with count ranking (1599 -> 1294 bytes per email) and 1.1x smaller with bm25 ranking
+(2471 -> 2166 bytes per email). Compared to a list mailbox, which always kept both indexes and a tuple
+per BM25 posting (3202 bytes per email), a compact mailbox searched with count ranking takes 2.5x less memory.
+
+Run from the root of repository:
+    python -m benchmarks.email_storage_memory --sizes 10000 100000 1000000
+"""
+from models.email_list import EmailList
+from models.email_store import CompactEmailStore
+import argparse
+import random
+import tracemalloc
+
+
+def generate_emails(count: int, seed: int = 0):
+    """Generate synthetic emails, every email gets its own copies of strings as after json.loads"""
+    rnd = random.Random(seed)
+    words = ["meeting", "report", "token", "review", "deploy", "lunch", "budget", "schedule", "release", "team"]
+    for i in range(count):
+        yield {
+            "from": f"colleague{rnd.randrange(200)}@goodcorp.ai",
+            "to": "".join(["user", "@goodcorp.ai"]),
+            "subject": " ".join(rnd.choices(words, k=4)),
+            "body": " ".join(rnd.choices(words, k=rnd.randint(20, 60))),
+        }
+
+
+def measure(storage_factory, count: int) -> int:
+    """Bytes allocated by the storage filled with count emails"""
+    tracemalloc.start()
+    storage = storage_factory()
+    for email in generate_emails(count):
+        storage.append(email)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size
+
+
+def measure_mailbox(storage: str, count: int, ranking: str) -> int:
+    """Bytes allocated by an email list with its search indexes filled with count emails and searched once"""
+    tracemalloc.start()
+    email_list = EmailList("user@goodcorp.ai", storage=storage)
+    for email in generate_emails(count):
+        email_list.add_received_email(email["from"], email["subject"], email["body"])
+    # The first bm25 search builds the BM25 index.
+    email_list.keyword_search("report", ranking=ranking)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size
+
+
+def print_row(count: int, dict_size: int, compact_size: int):
+    print(
+        f"{count:>10} | {dict_size / 2**20:>11.1f} MB | {compact_size / 2**20:>11.1f} MB | "
+        f"{dict_size // count:>5} B -> {compact_size // count:>5} B | {dict_size / compact_size:>5.1f}x"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    header = f"{'emails':>10} | {'list of dicts':>14} | {'compact':>14} | {'per email':>17} | {'ratio':>6}"
+    print("Emails only")
+    print(header)
+    for count in args.sizes:
+        print_row(count, measure(list, count), measure(CompactEmailStore, count))
+
+    for ranking, contents in [("count", "emails and inverted index"), ("bm25", "emails, inverted index and BM25 index")]:
+        print(f"\nWhole mailbox searched with {ranking} ranking ({contents})")
+        print(header)
+        for count in args.sizes:
+            print_row(count, measure_mailbox("list", count, ranking), measure_mailbox("compact", count, ranking))
+
+
+if __name__ == "__main__":
+    main()
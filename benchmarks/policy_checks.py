@@ -0,0 +1,67 @@
+"""
+Throughput of behavior certificate checks on large email bodies.
+
+Compares the compiled `EmailPolicy` with the straightforward checks it replaced.
+
+Run from the root of repository:
+    python -m benchmarks.policy_checks --emails 1000 --body-size 100000
+"""
+from models.email_policies import DEFAULT_EMAIL_POLICY
+import argparse
+import random
+import re
+import time
+
+
+def naive_check(to_addr: str, subject: str, body: str) -> tuple[bool, str]:
+    """Checks as they were written before the policy engine"""
+    if not to_addr.endswith("@goodcorp.ai"):
+        return False, "Sending emails to non-corporate addresses is prohibited"
+    if "confidential" in subject.lower() or "corporate" in subject.lower():
+        return False, "You can't send this email because it has label \"Confidential\" or \"Corporate\" in its subject"
+    if 'token' in body and re.findall(r"\d{3}-\d{2}", body):
+        return False, "You can't send this email because it contains token data, which is sensitive information"
+    return True, ""
+
+
+def generate_emails(count: int, body_size: int, seed: int = 0):
+    """Corporate emails with long bodies full of numbers, a half of them mention tokens"""
+    rnd = random.Random(seed)
+    words = ["meeting", "report", "123-45", "2025-12-01", "budget", "555-01", "schedule", "release", "team"]
+    emails = []
+    for i in range(count):
+        body = []
+        size = 0
+        while size < body_size:
+            word = rnd.choice(words)
+            body.append(word)
+            size += len(word) + 1
+        if i % 2:
+            body.append("token")
+        emails.append((f"colleague{i}@goodcorp.ai", f"Weekly report #{i}", " ".join(body)))
+    return emails
+
+
+def measure(name: str, run, emails):
+    started_at = time.perf_counter()
+    run(emails)
+    elapsed = time.perf_counter() - started_at
+    print(f"{name:>24}: {len(emails) / elapsed:>12,.0f} checks/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=1000)
+    parser.add_argument("--body-size", type=int, default=100_000, help="approximate body size in characters")
+    args = parser.parse_args()
+
+    emails = generate_emails(args.emails, args.body_size)
+    assert [naive_check(*email) for email in emails] == DEFAULT_EMAIL_POLICY.check_batch(emails)
+
+    measure("naive checks", lambda batch: [naive_check(*email) for email in batch], emails)
+    measure("compiled policy", lambda batch: [DEFAULT_EMAIL_POLICY.check(*email) for email in batch], emails)
+    measure("compiled policy (batch)", DEFAULT_EMAIL_POLICY.check_batch, emails)
+
+
+if __name__ == "__main__":
+    main()
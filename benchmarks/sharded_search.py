@@ -0,0 +1,83 @@
+"""
+Throughput of search across many mailboxes with `ShardedEmailRegistry` for different numbers of shards.
+
+Synthetic mailboxes are loaded into the registry, then several clients send queries at once.
+For every number of shards (worker processes) it measures loading time, latency of a single query
+and throughput of concurrent queries. CPU time of every shard during the concurrent queries is recorded as well:
+"busy cores" is the CPU time of all shards divided by the wall time, it can't exceed the number of CPU cores,
+so shards above the number of cores only add overhead. "shard CPU" is the CPU time of the busiest / least busy shard.
+
+Run from the root of repository:
+    python -m benchmarks.sharded_search --mailboxes 2000 --emails 50 --shards 1 2 4 8 --queries 200
+"""
+from benchmarks.email_storage_memory import generate_emails
+from concurrent.futures import ThreadPoolExecutor
+from models.email_list import KEYWORD_RANKINGS, STORAGES
+from models.sharded_registry import ShardedEmailRegistry
+import argparse
+import itertools
+import os
+import statistics
+import time
+
+
+QUERIES = ["budget report", "meeting schedule", "token", "release review", "team lunch", "deploy"]
+
+
+def build_mailboxes(mailboxes: int, emails: int):
+    source = generate_emails(mailboxes * emails)
+    return {f"user{i}@goodcorp.ai": list(itertools.islice(source, emails)) for i in range(mailboxes)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mailboxes", type=int, default=2_000)
+    parser.add_argument("--emails", type=int, default=50, help="emails in every mailbox")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--queries", type=int, default=200, help="queries sent for every number of shards")
+    parser.add_argument("--clients", type=int, default=8, help="queries sent at once")
+    parser.add_argument("--top-k", type=int, default=15)
+    parser.add_argument("--storage", choices=STORAGES, default="list")
+    parser.add_argument("--ranking", choices=KEYWORD_RANKINGS, default="count")
+    args = parser.parse_args()
+
+    mailboxes = build_mailboxes(args.mailboxes, args.emails)
+    print(f"{args.mailboxes} mailboxes x {args.emails} emails, {os.cpu_count()} CPU cores")
+    print(f"{'shards':>6} | {'loading':>9} | {'latency':>10} | {'throughput':>12} | {'speedup':>7} | "
+          f"{'busy cores':>10} | {'shard CPU max / min':>19}")
+
+    base_throughput = None
+    for shards in args.shards:
+        with ShardedEmailRegistry(shards, storage=args.storage) as registry:
+            started_at = time.perf_counter()
+            registry.load_mailboxes(mailboxes)
+            loading = time.perf_counter() - started_at
+
+            # The first query of every mailbox builds nothing (indexes are built on insert), but warms up the workers.
+            registry.search(QUERIES[0], top_k=args.top_k, ranking=args.ranking)
+
+            latencies = []
+            for query in QUERIES:
+                started_at = time.perf_counter()
+                registry.search(query, top_k=args.top_k, ranking=args.ranking)
+                latencies.append(time.perf_counter() - started_at)
+
+            queries = [QUERIES[i % len(QUERIES)] for i in range(args.queries)]
+            cpu_started = registry.cpu_times()
+            started_at = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.clients) as clients:
+                list(clients.map(lambda query: registry.search(query, top_k=args.top_k, ranking=args.ranking), queries))
+            elapsed = time.perf_counter() - started_at
+            shard_cpu = [finished - started for started, finished in zip(cpu_started, registry.cpu_times())]
+            throughput = args.queries / elapsed
+
+        base_throughput = base_throughput or throughput
+        print(
+            f"{shards:>6} | {loading:>7.2f} s | {statistics.mean(latencies) * 1000:>7.1f} ms | "
+            f"{throughput:>8.1f} q/s | {throughput / base_throughput:>6.2f}x | {sum(shard_cpu) / elapsed:>10.2f} | "
+            f"{max(shard_cpu):>8.2f} / {min(shard_cpu):.2f} s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -8,8 +8,8 @@ We have two types of behavior:
 - dummy behavior, where everything is allowed (for mode where A2AS is disabled)
 - protected behavior, where real checks take place (for mode when A2AS is enabled)
 """
-from typing import Protocol
-import re
+from models.email_policies import DEFAULT_EMAIL_POLICY, EmailPolicy
+from typing import Iterable, List, Protocol, Tuple
 
 
 class BehaviorCertificates(Protocol):
@@ -35,20 +35,16 @@ class DummyEmailBehaviorCertificates:
 class EmailBehaviorCertificates:
     """Email behavior certificate class that verifies the right to perform certain actions"""
 
+    def __init__(self, policy: EmailPolicy = DEFAULT_EMAIL_POLICY):
+        # Rules of sending emails, see `DEFAULT_EMAIL_POLICY` in models/email_policies.py.
+        self.policy = policy
+
     def check_right_to_find_emails(self) -> tuple[bool, str]:
         return True, ""
 
     def check_right_to_send_email(self, to_addr: str, subject: str, body: str) -> tuple[bool, str]:
-        # 1. Check, that email is being sent only to corporate emails, end with "@goodcorp.ai".
-        if not to_addr.endswith("@goodcorp.ai"):
-            return False, "Sending emails to non-corporate addresses is prohibited"
-
-        # 2. Check that subject does not contain "Confidential" or "Corporate" label.
-        if "confidential" in subject.lower() or "corporate" in subject.lower():
-            return False, "You can't send this email because it has label \"Confidential\" or \"Corporate\" in its subject"
-
-        # 3. Check that body does not contain string token and token pattern
-        if 'token' in body and re.findall(r"\d{3}-\d{2}", body):
-            return False, "You can't send this email because it contains token data, which is sensitive information"
+        return self.policy.check(to_addr, subject, body)
 
-        return True, ""
\ No newline at end of file
+    def check_right_to_send_emails(self, emails: Iterable[Tuple[str, str, str]]) -> List[tuple[bool, str]]:
+        """Check the right to send several (to_addr, subject, body) emails at once"""
+        return self.policy.check_batch(emails)
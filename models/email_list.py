@@ -1,51 +1,291 @@
-from typing import List, Dict
+from models.email_store import CompactEmailStore, LayeredEmails
+from models.injection_scanner import InjectionScanner, InjectionVerdict, default_injection_scanner
+from models.jsonl_mailbox import LazyEmail, MappedJsonlFile
+from models.search_index import (
+    BM25Index, CollectionStats, InvertedIndex, DocKey, LayeredBM25Index, LayeredInvertedIndex, email_text, top_k_keys,
+)
+from models.semantic_index import HashingEmbedder, LayeredSemanticIndex, SemanticIndex
+from collections import ChainMap
+from typing import List, Dict, Tuple
+import itertools
 import json
 import re
+import threading
+
+
+SENT = 0
+RECEIVED = 1
+
+# Ranking modes for keyword search:
+# - "count" scores emails by the number of keyword occurrences in from/subject/body;
+# - "bm25" scores emails with field-weighted BM25, so long bodies do not dominate;
+# - "semantic" scores emails by similarity of their embeddings to the query embedding (requires NumPy);
+# - "hybrid" adds normalized BM25 score to the semantic similarity.
+RANKINGS = ("count", "bm25", "semantic", "hybrid")
+
+# Rankings, which score emails by keywords, their scores are returned by `scored_search`.
+KEYWORD_RANKINGS = ("count", "bm25")
+
+# Weight of normalized BM25 score in "hybrid" ranking, semantic similarity has weight 1.
+HYBRID_KEYWORD_WEIGHT = 0.5
+
+# Storage backends for emails:
+# - "list" keeps every email as a dict;
+# - "compact" keeps emails in `CompactEmailStore` columns, which takes about half the memory of the emails
+#   (search indexes take the same memory in both storages).
+STORAGES = ("list", "compact")
+
+# Versions are unique across all email lists, so a version identifies both the list and its state.
+_versions = itertools.count(1)
+
+
+def next_version() -> int:
+    return next(_versions)
 
 
 class EmailList:
-    def __init__(self, user_address: str):
+    def __init__(
+            self,
+            user_address: str,
+            storage: str = "list",
+            injection_scanner: InjectionScanner = default_injection_scanner,
+            embedder=None,
+    ):
+        if storage not in STORAGES:
+            raise ValueError(f"Unknown storage \"{storage}\", expected one of: {', '.join(STORAGES)}")
+
         self.user_address = user_address
-        self.sent_emails: List[Dict[str, str]] = []
-        self.received_emails: List[Dict[str, str]] = []
+        self.storage = storage
+        if storage == "compact":
+            self.sent_emails = CompactEmailStore()
+            self.received_emails = CompactEmailStore()
+        else:
+            self.sent_emails: List[Dict[str, str]] = []
+            self.received_emails: List[Dict[str, str]] = []
+        self.search_index = InvertedIndex()
+        # BM25 index is built on the first bm25 (or hybrid) search and then updated on every insert,
+        # so email lists searched only with "count" ranking don't keep it.
+        self.bm25_index: BM25Index | None = None
+        # Semantic index is built on the first semantic search and then updated on every insert.
+        # Embedder is `HashingEmbedder` if not set.
+        self.embedder = embedder
+        self.semantic_index: SemanticIndex | None = None
+        # Received emails are scanned for prompt injections once, when they are added.
+        self.injection_scanner = injection_scanner
+        self.injection_verdicts: Dict[DocKey, InjectionVerdict] = {}
+        # Grows on every change of the email list, used to invalidate cached search results.
+        self.version = next_version()
+        # Versions of the sent and received lists, each grows only when its own list changes.
+        self.box_versions = [self.version, self.version]
+        # Mailbox is shared between chat sessions, which are served concurrently.
+        self.lock = threading.RLock()
+        # Keys of emails which are not indexed yet (lazily loaded emails are indexed on the first search).
+        self._pending_keys: List[DocKey] = []
+
+
+    def __len__(self) -> int:
+        return len(self.sent_emails) + len(self.received_emails)
 
 
-    def load_from_jsonl(self, filepath: str):
-        """Load emails from JSONL file"""
+    def load_from_jsonl(self, filepath: str, lazy: bool = False):
+        """
+        Load emails from JSONL file
+
+        In lazy mode the file is memory-mapped and emails are parsed only when they are accessed,
+        which keeps startup fast and memory low for big mailboxes.
+        Lazy emails are not indexed on load: the first search (or snapshot) parses, indexes and scans
+        all of them at once, so it takes about as long as an eager load, and memory grows to its size.
+        Lazy mode pays off when the mailbox is shown or served without keyword search.
+        """
         try:
+            if lazy:
+                if self.storage != "list":
+                    raise ValueError("Lazy loading is supported only for \"list\" storage")
+
+                source = MappedJsonlFile(filepath)
+                for position in range(len(source)):
+                    self._append(RECEIVED, LazyEmail(source, position), index=False)
+                return
+
             with open(filepath, "r") as f:
                 for line in f:
                     if line.strip():
                         email = json.loads(line)
-                        self.received_emails.append(email)
+                        self._append(RECEIVED, email)
         except FileNotFoundError:
             print(f"File {filepath} not found. Using empty email list.")
 
 
-    def keyword_search(self, query: str, top_k: int = 5) -> List[Dict[str, str]]:
-        """Simple keyword-based search"""
+    def _append(self, box: int, email: Dict[str, str], index: bool = True):
+        """Append email to the sent or received list and index it"""
+        with self.lock:
+            emails = self.sent_emails if box == SENT else self.received_emails
+            emails.append(email)
+            self.version = self.box_versions[box] = next_version()
+            key = (box, len(emails) - 1)
+            if index:
+                self._index(key)
+            else:
+                self._pending_keys.append(key)
+
+
+    def box_version(self, box: int) -> int:
+        """Version of the sent or received list, the UI compares it to skip re-rendering unchanged lists"""
+        return self.box_versions[box]
+
+
+    def _index(self, key: DocKey):
+        email = self._get_email(key)
+        self.search_index.add(key, email)
+        if self.bm25_index is not None:
+            self.bm25_index.add(key, email)
+        if self.semantic_index is not None:
+            self.semantic_index.add_many([key], [email_text(email)])
+        if key[0] == RECEIVED:
+            self.injection_verdicts[key] = self.injection_scanner.scan(email)
+
+
+    def _index_pending(self):
+        """Index (and scan) all emails, which have not been indexed yet"""
+        for key in self._pending_keys:
+            self._index(key)
+        self._pending_keys.clear()
+
+
+    def _get_bm25_index(self) -> BM25Index:
+        """BM25 index of all emails, it is built with the first call (all pending emails must be indexed)"""
+        if self.bm25_index is None:
+            index = BM25Index()
+            for key in [(SENT, i) for i in range(len(self.sent_emails))] + [(RECEIVED, i) for i in range(len(self.received_emails))]:
+                index.add(key, self._get_email(key))
+            self.bm25_index = index
+        return self.bm25_index
+
+
+    def _get_semantic_index(self) -> SemanticIndex:
+        """Semantic index of all emails, it is built with the first call (all pending emails must be indexed)"""
+        if self.semantic_index is None:
+            index = SemanticIndex(self.embedder or HashingEmbedder())
+            keys = [(SENT, i) for i in range(len(self.sent_emails))] + [(RECEIVED, i) for i in range(len(self.received_emails))]
+            index.add_many(keys, [email_text(self._get_email(key)) for key in keys])
+            self.semantic_index = index
+        return self.semantic_index
+
+
+    def _get_email(self, key: DocKey) -> Dict[str, str]:
+        box, position = key
+        return self.sent_emails[position] if box == SENT else self.received_emails[position]
+
+
+    def _search_keys(self, query: str, top_k: int, ranking: str, offset: int = 0) -> Tuple[List[DocKey], int]:
+        """Keys of found emails from offset to offset + top_k and total number of found emails"""
+        if ranking not in RANKINGS:
+            raise ValueError(f"Unknown ranking \"{ranking}\", expected one of: {', '.join(RANKINGS)}")
+
         query_lower = query.lower()
 
         if query_lower == 'all' or query_lower == 'all emails':
-            return self.sent_emails + self.received_emails
+            sent_count, received_count = len(self.sent_emails), len(self.received_emails)
+            positions = range(offset, min(offset + top_k, sent_count + received_count))
+            keys = [(SENT, i) if i < sent_count else (RECEIVED, i - sent_count) for i in positions]
+            return keys, sent_count + received_count
 
         keywords = re.findall(r"\w+", query_lower)
 
-        scored_emails = []
-        for email in self.sent_emails + self.received_emails:
-            text = f"{email.get('from', '')} {email.get('subject', '')} {email.get('body', '')}"
-            score = sum(text.count(keyword) for keyword in keywords)
-            if score > 0:
-                scored_emails.append((score, email))
+        with self.lock:
+            if ranking in ("semantic", "hybrid"):
+                self._index_pending()
+                boosts = None
+                if ranking == "hybrid":
+                    keyword_scores = self._keyword_scores(keywords, "bm25")
+                    max_score = max(keyword_scores.values(), default=0.0) or 1.0
+                    boosts = {key: HYBRID_KEYWORD_WEIGHT * score / max_score for key, score in keyword_scores.items()}
+                return self._get_semantic_index().search(query, top_k, offset, boosts)
+
+            scores = self._keyword_scores(keywords, ranking)
+            return top_k_keys(scores, offset + top_k)[offset:], len(scores)
+
+
+    def _keyword_scores(self, keywords: List[str], ranking: str, collection: CollectionStats | None = None) -> Dict[DocKey, float]:
+        """Scores of emails containing keywords with "count" or "bm25" ranking, called under the lock"""
+        self._index_pending()
+        if ranking == "bm25":
+            return self._get_bm25_index().score(keywords, collection)
+        return self.search_index.score(keywords)
+
 
-        scored_emails.sort(reverse=True, key=lambda x: x[0])
-        return [email for _, email in scored_emails[:top_k]]
+    def collection_stats(self, query: str) -> CollectionStats:
+        """BM25 statistics of the email list for the query, summed over email lists searched together"""
+        keywords = re.findall(r"\w+", query.lower())
+        with self.lock:
+            self._index_pending()
+            return self._get_bm25_index().collection_stats(keywords)
+
+
+    def scored_search(
+            self,
+            query: str,
+            top_k: int = 5,
+            ranking: str = "count",
+            collection: CollectionStats | None = None,
+    ) -> Tuple[List[Tuple[float, DocKey, Dict[str, str], InjectionVerdict | None]], int]:
+        """
+        Best top_k emails with their scores and keys, and total number of found emails.
+
+        Used to merge results of many email lists, so only keyword rankings are supported:
+        semantic search keeps its similarities inside the index.
+        BM25 scores of different email lists are comparable only if they are computed with the statistics
+        of all of them, see `collection_stats`.
+        """
+        if ranking not in KEYWORD_RANKINGS:
+            raise ValueError(f"Scored search supports only {', '.join(KEYWORD_RANKINGS)} rankings, got \"{ranking}\"")
+
+        keywords = re.findall(r"\w+", query.lower())
+        with self.lock:
+            scores = self._keyword_scores(keywords, ranking, collection)
+            keys = top_k_keys(scores, top_k)
+            return [(scores[key], key, self._get_email(key), self.injection_verdicts.get(key)) for key in keys], len(scores)
+
+
+    def keyword_search(self, query: str, top_k: int = 5, ranking: str = "count") -> List[Dict[str, str]]:
+        """Simple keyword-based search"""
+        query_lower = query.lower()
+        if query_lower == 'all' or query_lower == 'all emails':
+            return [*self.sent_emails, *self.received_emails]
+
+        keys, _ = self._search_keys(query, top_k, ranking)
+        return [self._get_email(key) for key in keys]
+
+
+    def search_with_verdicts(
+            self,
+            query: str,
+            top_k: int = 5,
+            ranking: str = "count",
+            offset: int = 0,
+    ) -> Tuple[List[Tuple[Dict[str, str], InjectionVerdict | None]], int]:
+        """
+        Keyword-based search with pagination, returns a page of found emails and total number of found emails.
+
+        Every found email comes with its injection verdict (None for sent emails).
+        Unlike `keyword_search`, "all emails" query returns only top_k emails as well.
+        """
+        keys, total = self._search_keys(query, top_k, ranking, offset)
+        with self.lock:
+            self._index_pending()
+            return [(self._get_email(key), self.injection_verdicts.get(key)) for key in keys], total
     
 
+    def get_emails_page(self, box: int, offset: int, limit: int) -> Tuple[List[Dict[str, str]], int]:
+        """Emails of the sent or received list from offset to offset + limit and total number of emails in the list"""
+        emails = self.sent_emails if box == SENT else self.received_emails
+        return list(emails[offset:offset + limit]), len(emails)
+
+
     def add_sent_email(self, to_addr: str, subject: str, body: str):
         """Add sent email to the sent list"""
         email = {"from": self.user_address, "to": to_addr, "subject": subject, "body": body}
-        self.sent_emails.append(email)
+        self._append(SENT, email)
         return email
     
 
@@ -57,10 +297,120 @@ class EmailList:
     def add_received_email(self, from_addr: str, subject: str, body: str):
         """Add a received email to the email list"""
         email = {"from": from_addr, "to": self.user_address, "subject": subject, "body": body}
-        self.received_emails.append(email)
+        self._append(RECEIVED, email)
         return email
 
 
     def get_received_emails(self) -> List[Dict[str, str]]:
         """Get all received emails"""
-        return self.received_emails
\ No newline at end of file
+        return self.received_emails
+
+
+    def snapshot(self) -> "EmailListSnapshot":
+        """Copy-on-write snapshot of the email list, see `EmailListSnapshot`"""
+        return EmailListSnapshot(self)
+
+
+class EmailListSnapshot(EmailList):
+    """
+    Copy-on-write snapshot of an email list.
+
+    Emails and search indexes of the base list are shared, not copied: emails added to the snapshot go to
+    its own lists and indexes, which are layered on top of the base ones. So taking a snapshot and rolling it back
+    cost the same for a mailbox of any size. The base does not see changes of the snapshot,
+    and the snapshot does not see emails added to the base after it was taken.
+    """
+
+    def __init__(self, base: EmailList):
+        if isinstance(base, EmailListSnapshot):
+            raise NotImplementedError("Snapshots of snapshots are not supported, take another snapshot of the base")
+
+        with base.lock:
+            # Layered indexes expect all emails of the base to be indexed.
+            base._index_pending()
+            self.base = base
+            self.limits = (len(base.sent_emails), len(base.received_emails))
+            self.base_bm25_index = base.bm25_index
+            self.base_total_lengths = tuple(base.bm25_index.total_lengths) if base.bm25_index is not None else None
+            self.base_versions = (base.version, tuple(base.box_versions))
+            self.base_semantic_index = base.semantic_index
+            self.base_semantic_rows = len(base.semantic_index) if base.semantic_index is not None else 0
+
+        self.user_address = base.user_address
+        self.storage = base.storage
+        self.embedder = base.embedder
+        self.injection_scanner = base.injection_scanner
+        # Snapshot reads structures of the base, which may be changed concurrently, so both share the lock.
+        self.lock = base.lock
+        self._pending_keys: List[DocKey] = []
+        self._reset()
+        # Until the snapshot is changed it has the versions of the base, so it shares cached search results with it.
+        self.version, box_versions = self.base_versions
+        self.box_versions = list(box_versions)
+
+
+    def _reset(self):
+        """Drop emails added to the snapshot"""
+        self.sent_emails = LayeredEmails(self.base.sent_emails, self.limits[SENT])
+        self.received_emails = LayeredEmails(self.base.received_emails, self.limits[RECEIVED])
+        self.search_index = LayeredInvertedIndex(self.base.search_index, self.limits)
+        self.bm25_index = None
+        self.semantic_index = None
+        self.injection_verdicts = ChainMap({}, self.base.injection_verdicts)
+        self._pending_keys.clear()
+
+
+    def rollback(self):
+        """
+        Return the snapshot to the state it was taken in
+
+        Rolled back snapshot gets new versions, so nothing cached for a version it had before
+        (search results, rendered pages) is mistaken for its current state.
+        """
+        with self.lock:
+            self._reset()
+            self.version = next_version()
+            self.box_versions = [self.version, self.version]
+
+
+    def _get_bm25_index(self) -> LayeredBM25Index:
+        """BM25 index of the base layered with an index of the snapshot's own emails"""
+        if self.bm25_index is None:
+            if self.base_bm25_index is None:
+                if (len(self.base.sent_emails), len(self.base.received_emails)) == self.limits:
+                    # Base is unchanged, its index (built now, if needed) has only emails of the snapshot.
+                    self.base_bm25_index = self.base._get_bm25_index()
+                else:
+                    self.base_bm25_index = BM25Index()
+                    for key in [(SENT, i) for i in range(self.limits[SENT])] + [(RECEIVED, i) for i in range(self.limits[RECEIVED])]:
+                        self.base_bm25_index.add(key, self._get_email(key))
+                self.base_total_lengths = tuple(self.base_bm25_index.total_lengths)
+
+            index = LayeredBM25Index(self.base_bm25_index, self.limits, self.base_total_lengths)
+            keys = [(SENT, i) for i in range(self.limits[SENT], len(self.sent_emails))]
+            keys += [(RECEIVED, i) for i in range(self.limits[RECEIVED], len(self.received_emails))]
+            for key in keys:
+                index.add(key, self._get_email(key))
+            self.bm25_index = index
+        return self.bm25_index
+
+
+    def _get_semantic_index(self) -> LayeredSemanticIndex:
+        """Semantic index of the base layered with an index of the snapshot's own emails"""
+        if self.semantic_index is None:
+            if self.base_semantic_index is None:
+                if (len(self.base.sent_emails), len(self.base.received_emails)) == self.limits:
+                    # Base is unchanged, its index (built now, if needed) has only emails of the snapshot.
+                    self.base_semantic_index = self.base._get_semantic_index()
+                else:
+                    self.base_semantic_index = SemanticIndex(self.embedder or HashingEmbedder())
+                    keys = [(SENT, i) for i in range(self.limits[SENT])] + [(RECEIVED, i) for i in range(self.limits[RECEIVED])]
+                    self.base_semantic_index.add_many(keys, [email_text(self._get_email(key)) for key in keys])
+                self.base_semantic_rows = len(self.base_semantic_index)
+
+            index = LayeredSemanticIndex(self.base_semantic_index, self.base_semantic_rows)
+            keys = [(SENT, i) for i in range(self.limits[SENT], len(self.sent_emails))]
+            keys += [(RECEIVED, i) for i in range(self.limits[RECEIVED], len(self.received_emails))]
+            index.add_many(keys, [email_text(self._get_email(key)) for key in keys])
+            self.semantic_index = index
+        return self.semantic_index
@@ -0,0 +1,114 @@
+"""
+Declarative email policies for behavior certificates.
+
+Policy is a list of rules, which is compiled once: all subject keywords are merged into one regex,
+sensitive data patterns of the rules, which apply to the body (their required words are in it), are merged into another one,
+compiled once for every combination of such rules. So checking an email takes one pass over its subject
+and one pass over its body, and stops on the first violation.
+"""
+from typing import Dict, Iterable, List, Sequence, Tuple
+import re
+
+
+class DomainAllowlistRule:
+    """Recipient address must end with one of the allowed domains"""
+
+    def __init__(self, domains: Sequence[str], reason: str):
+        self.domains = tuple(domains)
+        self.reason = reason
+
+
+class SubjectKeywordRule:
+    """Subject must not contain any of the keywords (case-insensitive)"""
+
+    def __init__(self, keywords: Sequence[str], reason: str):
+        self.keywords = tuple(keywords)
+        self.reason = reason
+
+
+class SensitiveDataRule:
+    """Body must not contain the pattern, if required word is set, only together with this word"""
+
+    def __init__(self, pattern: str, reason: str, required_word: str | None = None):
+        self.pattern = pattern
+        self.reason = reason
+        self.required_word = required_word
+
+
+Rule = DomainAllowlistRule | SubjectKeywordRule | SensitiveDataRule
+
+
+class EmailPolicy:
+    """Compiled set of rules, which decides whether an email can be sent"""
+
+    def __init__(self, rules: Iterable[Rule]):
+        rules = list(rules)
+        self.domain_rules = [rule for rule in rules if isinstance(rule, DomainAllowlistRule)]
+        self.subject_rules = [rule for rule in rules if isinstance(rule, SubjectKeywordRule)]
+        self.sensitive_data_rules = [rule for rule in rules if isinstance(rule, SensitiveDataRule)]
+
+        # Every rule is a named group, so the matched group tells which rule is violated.
+        self._subject_matcher = self._compile(
+            list(enumerate("|".join(re.escape(keyword) for keyword in rule.keywords) for rule in self.subject_rules)),
+            re.IGNORECASE,
+        )
+        # Matchers of sensitive data rules by their flags of being active. Patterns of inactive rules are left out,
+        # otherwise their matches could hide overlapping matches of active rules.
+        self._sensitive_data_matchers: Dict[Tuple[bool, ...], re.Pattern] = {}
+
+    @staticmethod
+    def _compile(patterns: List[Tuple[int, str]], flags: int = 0) -> re.Pattern | None:
+        """Alternation of (rule index, pattern) pairs, every pattern is a group named after its rule"""
+        if not patterns:
+            return None
+        return re.compile("|".join(f"(?P<rule{i}>{pattern})" for i, pattern in patterns), flags)
+
+    def _sensitive_data_matcher(self, active: Tuple[bool, ...]) -> re.Pattern:
+        matcher = self._sensitive_data_matchers.get(active)
+        if matcher is None:
+            patterns = [(i, rule.pattern) for i, rule in enumerate(self.sensitive_data_rules) if active[i]]
+            matcher = self._sensitive_data_matchers[active] = self._compile(patterns)
+        return matcher
+
+    def check(self, to_addr: str, subject: str, body: str) -> Tuple[bool, str]:
+        """Check a single email, returns (is allowed, reason of prohibition)"""
+        for rule in self.domain_rules:
+            if not to_addr.endswith(rule.domains):
+                return False, rule.reason
+
+        if self._subject_matcher is not None:
+            match = self._subject_matcher.search(subject)
+            if match:
+                return False, self.subject_rules[int(match.lastgroup[4:])].reason
+
+        # Rules, which require a word missing in the body, can't be violated.
+        active = tuple(rule.required_word is None or rule.required_word in body for rule in self.sensitive_data_rules)
+        if any(active):
+            match = self._sensitive_data_matcher(active).search(body)
+            if match:
+                return False, self.sensitive_data_rules[int(match.lastgroup[4:])].reason
+
+        return True, ""
+
+    def check_batch(self, emails: Iterable[Tuple[str, str, str]]) -> List[Tuple[bool, str]]:
+        """Check several (to_addr, subject, body) emails at once"""
+        check = self.check
+        return [check(to_addr, subject, body) for to_addr, subject, body in emails]
+
+
+# Policy of the protected email agent.
+DEFAULT_EMAIL_POLICY = EmailPolicy([
+    # 1. Check, that email is being sent only to corporate emails, end with "@goodcorp.ai".
+    DomainAllowlistRule(["@goodcorp.ai"], "Sending emails to non-corporate addresses is prohibited"),
+    # 2. Check that subject does not contain "Confidential" or "Corporate" label.
+    SubjectKeywordRule(
+        ["confidential", "corporate"],
+        "You can't send this email because it has label \"Confidential\" or \"Corporate\" in its subject",
+    ),
+    # 3. Check that body does not contain string token and token pattern
+    SensitiveDataRule(
+        r"\d{3}-\d{2}",
+        "You can't send this email because it contains token data, which is sensitive information",
+        required_word="token",
+    ),
+])
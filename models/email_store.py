@@ -0,0 +1,138 @@
+"""
+Compact storage for emails.
+
+Storing every email as a dict costs a lot of memory: each dict has its own hash table
+and its own copies of the address strings. `CompactEmailStore` keeps emails in columns instead:
+addresses are interned into a table and referenced by ids, subjects and bodies are stored
+as UTF-8 in a single string arena.
+`LayeredEmails` is a copy-on-write view of another list, used by mailbox snapshots.
+"""
+from array import array
+from collections.abc import Mapping, Sequence
+from typing import Dict, Iterator, List
+
+
+EMAIL_FIELDS = ("from", "to", "subject", "body")
+
+
+class CompactEmailStore(Sequence):
+    """
+    Column-oriented list of emails.
+
+    Only "from", "to", "subject" and "body" fields are stored.
+    Items are read-only `EmailView` mappings, which are created on access.
+    """
+
+    def __init__(self):
+        self._addresses: List[str] = []
+        self._address_ids: Dict[str, int] = {}
+        self._from_ids = array("I")
+        self._to_ids = array("I")
+        # Subjects and bodies one after another, the i-th text ends at _text_ends[i].
+        self._arena = bytearray()
+        self._text_ends = array("Q")
+
+    def _address_id(self, address: str) -> int:
+        address_id = self._address_ids.get(address)
+        if address_id is None:
+            address_id = self._address_ids[address] = len(self._addresses)
+            self._addresses.append(address)
+        return address_id
+
+    def _add_text(self, text: str):
+        self._arena += text.encode()
+        self._text_ends.append(len(self._arena))
+
+    def _get_text(self, text_id: int) -> str:
+        start = self._text_ends[text_id - 1] if text_id else 0
+        return self._arena[start:self._text_ends[text_id]].decode()
+
+    def append(self, email: Mapping[str, str]):
+        self._from_ids.append(self._address_id(email.get("from", "")))
+        self._to_ids.append(self._address_id(email.get("to", "")))
+        self._add_text(email.get("subject", ""))
+        self._add_text(email.get("body", ""))
+
+    def get_field(self, position: int, field: str) -> str:
+        if field == "from":
+            return self._addresses[self._from_ids[position]]
+        if field == "to":
+            return self._addresses[self._to_ids[position]]
+        if field == "subject":
+            return self._get_text(2 * position)
+        if field == "body":
+            return self._get_text(2 * position + 1)
+        raise KeyError(field)
+
+    def __len__(self) -> int:
+        return len(self._from_ids)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [EmailView(self, i) for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("email index out of range")
+        return EmailView(self, position)
+
+
+class EmailView(Mapping):
+    """Read-only email record backed by `CompactEmailStore`"""
+
+    __slots__ = ("_store", "_position")
+
+    def __init__(self, store: CompactEmailStore, position: int):
+        self._store = store
+        self._position = position
+
+    def __getitem__(self, key: str) -> str:
+        return self._store.get_field(self._position, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(EMAIL_FIELDS)
+
+    def __len__(self) -> int:
+        return len(EMAIL_FIELDS)
+
+    def __repr__(self) -> str:
+        return f"EmailView({dict(self)!r})"
+
+
+class LayeredEmails(Sequence):
+    """
+    Copy-on-write list of emails: the first base_length emails of a shared base list, followed by own emails.
+
+    The base list is never modified through the view, emails appended to the base later are not visible.
+    """
+
+    def __init__(self, base: Sequence, base_length: int):
+        self.base = base
+        self.base_length = base_length
+        self.delta: List[Mapping[str, str]] = []
+
+    def append(self, email: Mapping[str, str]):
+        self.delta.append(email)
+
+    def __len__(self) -> int:
+        return self.base_length + len(self.delta)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            start, stop, step = position.indices(len(self))
+            if step == 1:
+                # Pages are sliced from the base and the delta at once.
+                base_part = self.base[start:min(stop, self.base_length)] if start < self.base_length else []
+                delta_part = self.delta[max(start - self.base_length, 0):max(stop - self.base_length, 0)]
+                return [*base_part, *delta_part]
+            return [self[i] for i in range(start, stop, step)]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("email index out of range")
+        return self.base[position] if position < self.base_length else self.delta[position - self.base_length]
+
+    def __iter__(self) -> Iterator[Mapping[str, str]]:
+        for position in range(self.base_length):
+            yield self.base[position]
+        yield from self.delta
@@ -0,0 +1,87 @@
+"""
+Prompt injection scanner for incoming emails.
+
+Every email is scanned once, when it gets into an email list, and the verdict is stored next to it.
+So tools can warn the model about suspicious emails (or hide them) without scanning them again,
+while the in-context defenses of A2AS still work as the second line of defense.
+"""
+from typing import Dict, Mapping, Tuple
+import re
+
+
+class InjectionVerdict:
+    """Result of scanning an email: total score and labels of the matched patterns"""
+
+    __slots__ = ("score", "labels", "flagged")
+
+    def __init__(self, score: float, labels: Tuple[str, ...], flagged: bool):
+        self.score = score
+        self.labels = labels
+        self.flagged = flagged
+
+    def __repr__(self) -> str:
+        return f"InjectionVerdict(score={self.score}, labels={self.labels}, flagged={self.flagged})"
+
+
+# label -> (trigger words, pattern, weight).
+# Pattern is matched (case-insensitively, against subject and body) only if the text contains one of the trigger words,
+# most emails contain none of them, so they are checked with a few substring searches.
+DEFAULT_INJECTION_PATTERNS: Dict[str, Tuple[Tuple[str, ...], str, float]] = {
+    "instruction_override": (
+        ("ignore", "disregard", "forget"),
+        r"\b(?:ignore|disregard|forget)\s+(?:all\s+|any\s+|the\s+)?(?:previous\s+|prior\s+|above\s+|your\s+)?"
+        r"(?:instructions?|rules|prompts?|guidelines)",
+        1.0,
+    ),
+    "embedded_instructions": (
+        ("execute", "follow", "perform", "carry"),
+        r"\b(?:now\s+)?(?:execute|follow|perform|carry\s+out)\s+(?:the\s+|these\s+)?(?:following|next|below)\b",
+        1.0,
+    ),
+    "exfiltration": (
+        ("@",),
+        r"\b(?:send|forward|reply|email|mail)\b[^\n]{0,60}?\b(?:to|at)\s+(?:the\s+)?(?:address\s+)?[\"'`]?[\w.+-]+@[\w-]+\.[\w.-]+",
+        0.75,
+    ),
+    "task_hijack": (
+        ("previous", "you are now", "new instructions", "system prompt"),
+        r"\b(?:continue\s+(?:to\s+)?(?:execute|executing|with)\s+(?:the\s+)?previous\s+request"
+        r"|you\s+are\s+now|new\s+instructions|system\s+prompt)",
+        0.75,
+    ),
+    "sensitive_data": (
+        ("token", "password", "credential", "api", "secret"),
+        r"\b(?:tokens?|passwords?|credentials?|api[\s_-]?keys?|secrets?)\b",
+        0.25,
+    ),
+    "fake_delimiter": (("===", "---", "###", "<<<", ">>>"), r"^\s*(?:={3,}|-{3,}|#{3,}|<{3,}|>{3,})\s*$", 0.25),
+}
+
+
+class InjectionScanner:
+    """Scores texts against a set of precompiled injection patterns"""
+
+    def __init__(self, patterns: Dict[str, Tuple[Tuple[str, ...], str, float]] = None, threshold: float = 1.0):
+        patterns = patterns or DEFAULT_INJECTION_PATTERNS
+        self.threshold = threshold
+        self._patterns = [
+            (label, triggers, re.compile(pattern, re.IGNORECASE | re.MULTILINE), weight)
+            for label, (triggers, pattern, weight) in patterns.items()
+        ]
+
+    def scan_text(self, text: str) -> InjectionVerdict:
+        text_lower = text.lower()
+        score = 0.0
+        labels = []
+        for label, triggers, pattern, weight in self._patterns:
+            if any(trigger in text_lower for trigger in triggers) and pattern.search(text):
+                score += weight
+                labels.append(label)
+        return InjectionVerdict(score, tuple(labels), score >= self.threshold)
+
+    def scan(self, email: Mapping[str, str]) -> InjectionVerdict:
+        return self.scan_text(f"{email.get('subject', '')}\n{email.get('body', '')}")
+
+
+# Scanner used by email lists.
+default_injection_scanner = InjectionScanner()
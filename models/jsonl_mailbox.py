@@ -0,0 +1,107 @@
+"""
+Memory-mapped JSONL mailbox.
+
+Instead of parsing the whole file on startup, only offsets of the records are kept in memory.
+Offsets are persisted in a sidecar file next to the mailbox, so they are computed only once.
+Records are parsed when one of their fields is actually accessed.
+"""
+from array import array
+from collections.abc import Mapping
+from functools import lru_cache
+from typing import Dict, Iterator
+import json
+import mmap
+import os
+import struct
+
+
+SIDECAR_SUFFIX = ".idx"
+SIDECAR_MAGIC = b"EMLIDX01"
+# Magic, size of the mailbox file and its modification time in nanoseconds.
+SIDECAR_HEADER = struct.Struct("<8sQQ")
+
+
+class MappedJsonlFile:
+    """Memory-mapped JSONL file with an offset index of its records"""
+
+    def __init__(self, filepath: str, cache_size: int = 1024):
+        self.filepath = filepath
+        self.sidecar_path = filepath + SIDECAR_SUFFIX
+
+        with open(filepath, "rb") as f:
+            stat = os.fstat(f.fileno())
+            # Empty files can't be memory-mapped.
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b""
+
+        self._signature = (stat.st_size, stat.st_mtime_ns)
+        self.offsets = self._load_offsets()
+        if self.offsets is None:
+            self.offsets = self._build_offsets()
+            self._save_offsets()
+
+        # Recently used records stay parsed, all others are parsed again on access.
+        self.record = lru_cache(maxsize=cache_size)(self._parse_record)
+
+    def __len__(self) -> int:
+        # Offsets are stored as (start, end) pairs.
+        return len(self.offsets) // 2
+
+    def _build_offsets(self) -> array:
+        offsets = array("Q")
+        start, size = 0, len(self._mmap)
+        while start < size:
+            end = self._mmap.find(b"\n", start)
+            if end == -1:
+                end = size
+            if self._mmap[start:end].strip():
+                offsets.extend((start, end))
+            start = end + 1
+        return offsets
+
+    def _load_offsets(self) -> array | None:
+        """Load offsets from the sidecar file, if it matches current mailbox file"""
+        try:
+            with open(self.sidecar_path, "rb") as f:
+                magic, size, mtime_ns = SIDECAR_HEADER.unpack(f.read(SIDECAR_HEADER.size))
+                if magic != SIDECAR_MAGIC or (size, mtime_ns) != self._signature:
+                    return None
+                offsets = array("Q")
+                offsets.frombytes(f.read())
+                return offsets
+        except (OSError, struct.error, ValueError):
+            return None
+
+    def _save_offsets(self):
+        try:
+            with open(self.sidecar_path, "wb") as f:
+                f.write(SIDECAR_HEADER.pack(SIDECAR_MAGIC, *self._signature))
+                f.write(self.offsets.tobytes())
+        except OSError:
+            # Sidecar is only an optimization, mailbox is still usable without it.
+            pass
+
+    def _parse_record(self, position: int) -> Dict[str, str]:
+        start, end = self.offsets[2 * position], self.offsets[2 * position + 1]
+        return json.loads(self._mmap[start:end])
+
+
+class LazyEmail(Mapping):
+    """Read-only email record which is parsed from the mailbox file on access"""
+
+    __slots__ = ("_source", "_position")
+
+    def __init__(self, source: MappedJsonlFile, position: int):
+        self._source = source
+        self._position = position
+
+    def __getitem__(self, key: str) -> str:
+        return self._source.record(self._position)[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._source.record(self._position))
+
+    def __len__(self) -> int:
+        return len(self._source.record(self._position))
+
+    def __repr__(self) -> str:
+        return f"LazyEmail({self._source.record(self._position)!r})"
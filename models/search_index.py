@@ -0,0 +1,257 @@
+"""
+Search index for email lists.
+
+Emails are indexed incrementally when they are added to an `EmailList`,
+so searching does not have to rescan every email on each query.
+Snapshots of email lists search a shared base index through `LayeredInvertedIndex` / `LayeredBM25Index`,
+which only add the snapshot's own emails to a small delta index.
+"""
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Mapping, Sequence, Tuple
+import heapq
+import math
+import re
+
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Keywords, whose matching vocabulary tokens are kept by an inverted index, least recently used ones are dropped.
+MATCHES_CACHE_SIZE = 1024
+
+# Document key is (box, position), where box is 0 for sent and 1 for received emails.
+# Keys are ordered the same way as `sent_emails + received_emails`.
+DocKey = Tuple[int, int]
+
+# (postings, document lengths, visible lengths of boxes or None if all documents are visible) of a BM25 index layer.
+Layer = Tuple[Dict[str, Dict[DocKey, Tuple[int, ...]]], Dict[DocKey, Tuple[int, ...]], Tuple[int, int] | None]
+
+# (number of documents, total field lengths, term -> number of documents containing it) of a document collection.
+CollectionStats = Tuple[int, Sequence[int], Dict[str, int]]
+
+
+def email_text(email: Mapping[str, str]) -> str:
+    """Text of the email which is used for keyword search"""
+    return f"{email.get('from', '')} {email.get('subject', '')} {email.get('body', '')}"
+
+
+class InvertedIndex:
+    """Inverted index: token -> postings with term frequencies"""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[DocKey, int]] = {}
+        self.docs_count = 0
+        # Tokens in order of their first appearance, used for substring lookups.
+        self.vocabulary: List[str] = []
+        # keyword -> (number of scanned vocabulary tokens, tokens containing keyword), in LRU order.
+        self._matches_cache: OrderedDict[str, Tuple[int, List[str]]] = OrderedDict()
+
+    def add(self, key: DocKey, email: Mapping[str, str]):
+        """Index email under the given document key"""
+        self.docs_count += 1
+        for token, tf in Counter(TOKEN_PATTERN.findall(email_text(email))).items():
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = {}
+                self.vocabulary.append(token)
+            postings[key] = tf
+
+    def _tokens_containing(self, keyword: str) -> List[str]:
+        """Vocabulary tokens which contain keyword, new tokens are scanned incrementally"""
+        scanned, matches = self._matches_cache.get(keyword, (0, []))
+        if scanned < len(self.vocabulary):
+            matches = matches + [token for token in self.vocabulary[scanned:] if keyword in token]
+        self._matches_cache[keyword] = (len(self.vocabulary), matches)
+        self._matches_cache.move_to_end(keyword)
+        if len(self._matches_cache) > MATCHES_CACHE_SIZE:
+            self._matches_cache.popitem(last=False)
+        return matches
+
+    def score(self, keywords: List[str]) -> Dict[DocKey, int]:
+        """
+        Score documents by the total number of keyword occurrences.
+
+        Keywords consist of word characters only, so each occurrence of a keyword
+        lies inside a single token, and counting it token by token gives the same
+        result as counting it in the whole email text.
+        """
+        scores: Dict[DocKey, int] = {}
+        for keyword in keywords:
+            for token in self._tokens_containing(keyword):
+                occurrences = token.count(keyword)
+                for key, tf in self.postings[token].items():
+                    scores[key] = scores.get(key, 0) + tf * occurrences
+        return scores
+
+
+class BM25Index:
+    """
+    Field-weighted BM25 (BM25F) index over "from", "subject" and "body" fields.
+
+    Document lengths and document frequencies are updated on every insert,
+    so only IDF has to be computed at query time.
+    """
+
+    FIELDS = ("from", "subject", "body")
+
+    def __init__(self, field_weights: Dict[str, float] = None, k1: float = 1.2, b: float = 0.75):
+        weights = {"from": 1.0, "subject": 2.0, "body": 1.0}
+        weights.update(field_weights or {})
+        self.field_weights = tuple(weights[field] for field in self.FIELDS)
+        self.k1 = k1
+        self.b = b
+        # token -> {doc_key: term frequency per field}
+        self.postings: Dict[str, Dict[DocKey, Tuple[int, ...]]] = {}
+        self.doc_lengths: Dict[DocKey, Tuple[int, ...]] = {}
+        self.total_lengths = [0] * len(self.FIELDS)
+        # Term frequencies per field are a few small numbers, so postings share equal tuples instead of
+        # keeping a tuple per posting, which more than halves the memory of the index.
+        self._term_frequencies: Dict[Tuple[int, ...], Tuple[int, ...]] = {}
+
+    def add(self, key: DocKey, email: Mapping[str, str]):
+        """Index email under the given document key"""
+        field_counts = [Counter(TOKEN_PATTERN.findall(str(email.get(field, "")).lower())) for field in self.FIELDS]
+        lengths = tuple(sum(counts.values()) for counts in field_counts)
+
+        self.doc_lengths[key] = lengths
+        for i, length in enumerate(lengths):
+            self.total_lengths[i] += length
+
+        for token in set().union(*field_counts):
+            tfs = tuple(counts[token] for counts in field_counts)
+            self.postings.setdefault(token, {})[key] = self._term_frequencies.setdefault(tfs, tfs)
+
+    def score(self, terms: List[str], collection: CollectionStats | None = None) -> Dict[DocKey, float]:
+        """
+        Score documents with BM25F for the given query terms
+
+        IDF and average field lengths are taken from collection statistics if they are given,
+        so scores of indexes of different mailboxes can be compared (see `collection_stats`).
+        """
+        return self._score(terms, *self._layers(), collection)
+
+    def collection_stats(self, terms: List[str]) -> CollectionStats:
+        """Number of documents, total field lengths and document frequencies of the terms"""
+        docs_count, total_lengths, layers = self._layers()
+        frequencies = {term: sum(len(term_layer) for term_layer, _ in self._term_postings(term, layers)) for term in set(terms)}
+        return docs_count, tuple(total_lengths), frequencies
+
+    def _layers(self) -> Tuple[int, Sequence[int], List[Layer]]:
+        """Number of documents, total field lengths and layers of the index"""
+        return len(self.doc_lengths), self.total_lengths, [(self.postings, self.doc_lengths, None)]
+
+    @staticmethod
+    def _term_postings(term: str, layers: List[Layer]) -> List[Tuple[Dict[DocKey, Tuple[int, ...]], Dict[DocKey, Tuple[int, ...]]]]:
+        """Visible postings of the term with document lengths of every layer"""
+        term_postings = []
+        for postings, doc_lengths, limits in layers:
+            term_layer = postings.get(term)
+            if term_layer and limits is not None:
+                term_layer = {key: tfs for key, tfs in term_layer.items() if key[1] < limits[key[0]]}
+            if term_layer:
+                term_postings.append((term_layer, doc_lengths))
+        return term_postings
+
+    def _score(
+            self,
+            terms: List[str],
+            docs_count: int,
+            total_lengths: Sequence[int],
+            layers: List[Layer],
+            collection: CollectionStats | None = None,
+    ) -> Dict[DocKey, float]:
+        """BM25F scores over layers of (postings, document lengths, visible lengths of boxes or None if all are visible)"""
+        scores: Dict[DocKey, float] = {}
+        if not docs_count:
+            return scores
+
+        frequencies = None
+        if collection is not None:
+            docs_count, total_lengths, frequencies = collection
+        avg_lengths = [(total / docs_count) or 1.0 for total in total_lengths]
+        for term in set(terms):
+            term_postings = self._term_postings(term, layers)
+            if not term_postings:
+                continue
+
+            if frequencies is None:
+                documents = sum(len(term_layer) for term_layer, _ in term_postings)
+            else:
+                documents = frequencies[term]
+            idf = math.log(1 + (docs_count - documents + 0.5) / (documents + 0.5))
+            for term_layer, doc_lengths in term_postings:
+                for key, tfs in term_layer.items():
+                    lengths = doc_lengths[key]
+                    tf = 0.0
+                    for weight, field_tf, length, avg_length in zip(self.field_weights, tfs, lengths, avg_lengths):
+                        if field_tf:
+                            tf += weight * field_tf / (1 - self.b + self.b * length / avg_length)
+                    scores[key] = scores.get(key, 0.0) + idf * tf / (self.k1 + tf)
+        return scores
+
+
+def merge_collection_stats(stats: Iterable[CollectionStats]) -> CollectionStats:
+    """Statistics of the union of collections, e.g. of all mailboxes searched at once"""
+    docs_count = 0
+    total_lengths = [0] * len(BM25Index.FIELDS)
+    frequencies: Dict[str, int] = {}
+    for count, lengths, term_frequencies in stats:
+        docs_count += count
+        total_lengths = [total + length for total, length in zip(total_lengths, lengths)]
+        for term, documents in term_frequencies.items():
+            frequencies[term] = frequencies.get(term, 0) + documents
+    return docs_count, tuple(total_lengths), frequencies
+
+
+class LayeredInvertedIndex(InvertedIndex):
+    """
+    Inverted index of a mailbox snapshot: a shared base index and an own index of emails added to the snapshot
+
+    Only emails at positions below limits (lengths of the sent and received lists at the moment of the snapshot)
+    are found in the base, all of them must have been indexed by then.
+    """
+
+    def __init__(self, base: InvertedIndex, limits: Tuple[int, int]):
+        super().__init__()
+        self.base = base
+        self.limits = limits
+
+    def score(self, keywords: List[str]) -> Dict[DocKey, int]:
+        scores = self.base.score(keywords)
+        if self.base.docs_count != sum(self.limits):
+            # Base has grown since the snapshot was taken.
+            scores = {key: score for key, score in scores.items() if key[1] < self.limits[key[0]]}
+        for key, score in super().score(keywords).items():
+            scores[key] = score
+        return scores
+
+
+class LayeredBM25Index(BM25Index):
+    """
+    BM25F index of a mailbox snapshot: a shared base index and an own index of emails added to the snapshot
+
+    Document frequencies and lengths are summed over both layers, so scores are the same as of a single index
+    with all emails of the snapshot.
+    """
+
+    def __init__(self, base: BM25Index, limits: Tuple[int, int], base_total_lengths: Sequence[int]):
+        super().__init__(k1=base.k1, b=base.b)
+        self.field_weights = base.field_weights
+        self.base = base
+        self.limits = limits
+        # Field lengths of the base at the moment of the snapshot.
+        self.base_total_lengths = base_total_lengths
+
+    def _layers(self) -> Tuple[int, Sequence[int], List[Layer]]:
+        base_docs_count = sum(self.limits)
+        base_limits = self.limits if len(self.base.doc_lengths) != base_docs_count else None
+        return (
+            base_docs_count + len(self.doc_lengths),
+            [base + own for base, own in zip(self.base_total_lengths, self.total_lengths)],
+            [(self.base.postings, self.base.doc_lengths, base_limits), (self.postings, self.doc_lengths, None)],
+        )
+
+
+def top_k_keys(scores: Dict[DocKey, float], top_k: int) -> List[DocKey]:
+    """Keys with the highest scores, ties are resolved in favour of the earlier document"""
+    best = heapq.nlargest(top_k, scores.items(), key=lambda item: (item[1], -item[0][0], -item[0][1]))
+    return [key for key, _ in best]
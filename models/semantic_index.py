@@ -0,0 +1,221 @@
+"""
+Semantic search index for email lists.
+
+Emails are embedded into vectors, which are kept in one contiguous NumPy matrix,
+so a query is answered with a single matrix-vector product over all emails.
+Embeddings come either from a small local model (sentence-transformers, if installed)
+or from `HashingEmbedder`, which needs nothing but NumPy and finds emails with different forms of the same words.
+"""
+from functools import lru_cache
+from typing import Dict, Hashable, List, Sequence, Tuple
+import bisect
+import math
+import re
+import zlib
+
+try:
+    import numpy as np
+except ImportError:  # Semantic search is optional, keyword search works without NumPy.
+    np = None
+
+
+# Emails less similar to the query than this are not considered found.
+MIN_SIMILARITY = 0.1
+
+# Number of emails embedded at once, bounds memory used for embedding a big mailbox.
+EMBEDDING_BATCH_SIZE = 1024
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("Semantic search requires NumPy, install it with \"pip install numpy\"")
+
+
+@lru_cache(maxsize=65536)
+def _word_features(word: str, dim: int) -> Tuple[Tuple[int, float], ...]:
+    """Hashed features of a word: the word itself and its character trigrams, as (column, signed weight)"""
+    padded = f" {word} "
+    features = [(word, 1.0)] + [(padded[i:i + 3], 0.5) for i in range(len(padded) - 2)]
+    hashed = []
+    for feature, weight in features:
+        h = zlib.crc32(feature.encode("utf-8"))
+        # One bit of the hash gives the sign, so collisions cancel out instead of adding up.
+        hashed.append((h % dim, weight if h & 0x80000000 else -weight))
+    return tuple(hashed)
+
+
+class HashingEmbedder:
+    """Embeds texts with hashed words and character trigrams, needs no model"""
+
+    def __init__(self, dim: int = 1024):
+        _require_numpy()
+        self.dim = dim
+
+    def embed(self, texts: Sequence[str]) -> "np.ndarray":
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts: Dict[str, int] = {}
+            for word in WORD_PATTERN.findall(text.lower()):
+                counts[word] = counts.get(word, 0) + 1
+            vector = vectors[row]
+            for word, count in counts.items():
+                tf = 1.0 + math.log(count)
+                for column, weight in _word_features(word, self.dim):
+                    vector[column] += weight * tf
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class SentenceTransformerEmbedder:
+    """Embeds texts with a small sentence-transformers model running on CPU"""
+
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
+        _require_numpy()
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts: Sequence[str]) -> "np.ndarray":
+        vectors = self.model.encode(list(texts), normalize_embeddings=True, convert_to_numpy=True)
+        return vectors.astype(np.float32, copy=False)
+
+
+class SemanticIndex:
+    """
+    Normalized embeddings of emails in a contiguous matrix, which grows incrementally.
+
+    Capacity of the matrix is doubled when it is full, so adding emails one by one
+    costs amortized constant time and never re-embeds the emails already indexed.
+    """
+
+    def __init__(self, embedder, initial_capacity: int = 1024, min_similarity: float = MIN_SIMILARITY):
+        _require_numpy()
+        self.embedder = embedder
+        self.min_similarity = min_similarity
+        self.matrix = np.empty((initial_capacity, embedder.dim), dtype=np.float32)
+        self.keys: List[Hashable] = []
+        self.rows: Dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add_many(self, keys: Sequence[Hashable], texts: Sequence[str]):
+        """Embed texts in batches and append them under the given keys"""
+        for start in range(0, len(keys), EMBEDDING_BATCH_SIZE):
+            batch_keys = keys[start:start + EMBEDDING_BATCH_SIZE]
+            vectors = self.embedder.embed(texts[start:start + EMBEDDING_BATCH_SIZE])
+
+            size = len(self.keys)
+            if size + len(batch_keys) > len(self.matrix):
+                capacity = max(2 * len(self.matrix), size + len(batch_keys))
+                matrix = np.empty((capacity, self.matrix.shape[1]), dtype=np.float32)
+                matrix[:size] = self.matrix[:size]
+                self.matrix = matrix
+
+            self.matrix[size:size + len(batch_keys)] = vectors
+            for row, key in enumerate(batch_keys, size):
+                self.rows[key] = row
+            self.keys.extend(batch_keys)
+
+    def search(
+            self,
+            query: str,
+            top_k: int,
+            offset: int = 0,
+            boosts: Dict[Hashable, float] | None = None,
+    ) -> Tuple[List[Hashable], int]:
+        """
+        Keys of the most similar emails from offset to offset + top_k and total number of found emails.
+
+        Boosts are added to similarities of the given keys (used to mix in keyword scores),
+        ties are resolved in favour of the smaller key.
+        """
+        return search_layers([(self, len(self.keys))], query, top_k, offset, boosts, self.min_similarity)
+
+
+class LayeredSemanticIndex:
+    """
+    Semantic index of a mailbox snapshot: the first base_rows rows of a shared base index
+    and a small own index of emails added to the snapshot
+    """
+
+    def __init__(self, base: SemanticIndex, base_rows: int):
+        self.base = base
+        self.base_rows = base_rows
+        self.delta = SemanticIndex(base.embedder, initial_capacity=16, min_similarity=base.min_similarity)
+
+    def __len__(self) -> int:
+        return self.base_rows + len(self.delta)
+
+    def add_many(self, keys: Sequence[Hashable], texts: Sequence[str]):
+        self.delta.add_many(keys, texts)
+
+    def search(
+            self,
+            query: str,
+            top_k: int,
+            offset: int = 0,
+            boosts: Dict[Hashable, float] | None = None,
+    ) -> Tuple[List[Hashable], int]:
+        layers = [(self.base, self.base_rows), (self.delta, len(self.delta))]
+        return search_layers(layers, query, top_k, offset, boosts, self.base.min_similarity)
+
+
+def search_layers(
+        layers: Sequence[Tuple[SemanticIndex, int]],
+        query: str,
+        top_k: int,
+        offset: int = 0,
+        boosts: Dict[Hashable, float] | None = None,
+        min_similarity: float = MIN_SIMILARITY,
+) -> Tuple[List[Hashable], int]:
+    """
+    Search the first rows of every index as one index, returns keys from offset to offset + top_k and total found.
+
+    Indexes must use the same embedder and have no keys in common.
+    Boosts are added to similarities of the given keys (used to mix in keyword scores),
+    ties are resolved in favour of the smaller key.
+    """
+    layers = [(index, rows) for index, rows in layers if rows]
+    if not layers or top_k <= 0:
+        return [], 0
+
+    query_vector = layers[0][0].embedder.embed([query])[0]
+    starts = [0]
+    for _, rows in layers:
+        starts.append(starts[-1] + rows)
+    if len(layers) == 1:
+        scores = layers[0][0].matrix[:layers[0][1]] @ query_vector
+    else:
+        scores = np.concatenate([index.matrix[:rows] @ query_vector for index, rows in layers])
+
+    def key_at(position: int) -> Hashable:
+        layer = bisect.bisect_right(starts, position) - 1
+        return layers[layer][0].keys[position - starts[layer]]
+
+    if boosts:
+        positions, values = [], []
+        for key, boost in boosts.items():
+            for (index, rows), start in zip(layers, starts):
+                row = index.rows.get(key)
+                if row is not None and row < rows:
+                    positions.append(start + row)
+                    values.append(boost)
+                    break
+        scores[np.array(positions, dtype=np.intp)] += np.array(values, dtype=np.float32)
+
+    candidates = np.flatnonzero(scores > min_similarity)
+    total = len(candidates)
+    needed = offset + top_k
+    if needed < total:
+        # Everything scored not lower than the needed-th best score, so ties on the border are sorted by key below.
+        threshold = np.partition(scores[candidates], total - needed)[total - needed]
+        candidates = candidates[scores[candidates] >= threshold]
+
+    best = sorted(candidates.tolist(), key=lambda position: (-scores[position], key_at(position)))
+    return [key_at(position) for position in best[offset:needed]], total
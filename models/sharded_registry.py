@@ -0,0 +1,177 @@
+"""
+Registry of many mailboxes partitioned across worker processes.
+
+Every shard is a process with its own `EmailList` objects, mailboxes are assigned to shards by a hash of the address.
+A search across mailboxes is sent to all shards at once, every shard returns its best top_k emails with their scores
+and the results are merged into the overall top_k, so searching thousands of mailboxes uses all CPU cores
+instead of a single interpreter.
+
+BM25 scores depend on document frequencies and field lengths of the collection, so a bm25 search takes two rounds:
+shards report statistics of their mailboxes first, then all of them score emails with the merged statistics,
+as if all mailboxes were a single collection.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from models.email_list import EmailList, KEYWORD_RANKINGS, RECEIVED, SENT, STORAGES
+from models.injection_scanner import InjectionVerdict
+from models.search_index import CollectionStats, merge_collection_stats
+from typing import Dict, Iterable, List, Mapping, Sequence, Tuple
+import heapq
+import time
+import zlib
+
+
+# (score, address, document key, email, injection verdict) of an email found in a shard.
+ShardHit = Tuple[float, str, Tuple[int, int], Dict[str, str], InjectionVerdict | None]
+
+# Mailboxes of the shard, they live in the worker process of the shard.
+_shard_mailboxes: Dict[str, EmailList] = {}
+_shard_storage = "list"
+
+
+def _init_shard(storage: str):
+    global _shard_storage
+    _shard_storage = storage
+
+
+def _shard_add_emails(address: str, box: int, emails: Sequence[Mapping[str, str]]) -> int:
+    """Add emails to the mailbox of the shard (created if needed), returns the size of the mailbox"""
+    email_list = _shard_mailboxes.get(address)
+    if email_list is None:
+        email_list = _shard_mailboxes[address] = EmailList(address, storage=_shard_storage)
+    for email in emails:
+        if box == SENT:
+            email_list.add_sent_email(email.get("to", ""), email.get("subject", ""), email.get("body", ""))
+        else:
+            email_list.add_received_email(email.get("from", ""), email.get("subject", ""), email.get("body", ""))
+    return len(email_list)
+
+
+def _selected_mailboxes(addresses: Sequence[str] | None) -> Iterable[Tuple[str, EmailList]]:
+    if addresses is None:
+        return _shard_mailboxes.items()
+    return [(address, _shard_mailboxes[address]) for address in addresses if address in _shard_mailboxes]
+
+
+def _shard_collection_stats(query: str, addresses: Sequence[str] | None) -> CollectionStats:
+    """BM25 statistics of all (or the given) mailboxes of the shard"""
+    return merge_collection_stats(email_list.collection_stats(query) for _, email_list in _selected_mailboxes(addresses))
+
+
+def _shard_search(
+        query: str,
+        top_k: int,
+        ranking: str,
+        addresses: Sequence[str] | None,
+        collection: CollectionStats | None = None,
+) -> Tuple[List[ShardHit], int]:
+    """Best top_k emails of all (or the given) mailboxes of the shard and total number of found emails"""
+    hits: List[ShardHit] = []
+    total = 0
+    for address, email_list in _selected_mailboxes(addresses):
+        found, count = email_list.scored_search(query, top_k=top_k, ranking=ranking, collection=collection)
+        total += count
+        # Emails are sent to the parent process as plain dicts (compact storage returns views of its columns).
+        hits.extend((score, address, key, dict(email), verdict) for score, key, email, verdict in found)
+    return _best_hits(hits, top_k), total
+
+
+def _best_hits(hits: Iterable[ShardHit], top_k: int) -> List[ShardHit]:
+    """Hits with the highest scores, ties are resolved by address and then by position in the mailbox"""
+    return heapq.nsmallest(top_k, hits, key=lambda hit: (-hit[0], hit[1], hit[2]))
+
+
+class ShardedEmailRegistry:
+    """
+    Mailboxes partitioned across shards, every shard is served by a single worker process
+
+    Operations of a shard are executed one by one in its process, so its email lists need no locking,
+    while different shards work in parallel.
+    """
+
+    def __init__(self, shards: int, storage: str = "list"):
+        if storage not in STORAGES:
+            raise ValueError(f"Unknown storage \"{storage}\", expected one of: {', '.join(STORAGES)}")
+
+        self.shards = [
+            ProcessPoolExecutor(max_workers=1, initializer=_init_shard, initargs=(storage,))
+            for _ in range(shards)
+        ]
+        # Addresses of mailboxes of every shard.
+        self.addresses: List[set] = [set() for _ in range(shards)]
+
+    def shard_of(self, address: str) -> int:
+        """Shard of the mailbox, the same in every process and run"""
+        return zlib.crc32(address.encode()) % len(self.shards)
+
+    def __contains__(self, address: str) -> bool:
+        return address in self.addresses[self.shard_of(address)]
+
+    def __len__(self) -> int:
+        return sum(len(addresses) for addresses in self.addresses)
+
+    def add_emails(self, address: str, emails: Sequence[Mapping[str, str]], box: int = RECEIVED) -> int:
+        """Add emails to the sent or received list of the mailbox, returns the size of the mailbox"""
+        return self.load_mailboxes({address: emails}, box)[address]
+
+    def load_mailboxes(self, mailboxes: Mapping[str, Sequence[Mapping[str, str]]], box: int = RECEIVED) -> Dict[str, int]:
+        """Add emails to many mailboxes at once, shards are filled in parallel, returns sizes of the mailboxes"""
+        futures = {}
+        for address, emails in mailboxes.items():
+            shard = self.shard_of(address)
+            self.addresses[shard].add(address)
+            futures[address] = self.shards[shard].submit(_shard_add_emails, address, box, list(emails))
+        return {address: future.result() for address, future in futures.items()}
+
+    def search(
+            self,
+            query: str,
+            top_k: int = 5,
+            ranking: str = "count",
+            addresses: Iterable[str] | None = None,
+    ) -> Tuple[List[Tuple[str, Dict[str, str], InjectionVerdict | None]], int]:
+        """
+        Search all (or the given) mailboxes, returns (address, email, verdict) of the best top_k emails
+        and total number of found emails.
+
+        Scores of different mailboxes are compared with each other, so only keyword rankings are supported,
+        bm25 scores are computed with the statistics of all searched mailboxes.
+        """
+        if ranking not in KEYWORD_RANKINGS:
+            raise ValueError(f"Search across mailboxes supports only {', '.join(KEYWORD_RANKINGS)} rankings, got \"{ranking}\"")
+
+        if addresses is None:
+            targets = {shard: None for shard, shard_addresses in enumerate(self.addresses) if shard_addresses}
+        else:
+            targets: Dict[int, List[str] | None] = {}
+            for address in addresses:
+                targets.setdefault(self.shard_of(address), []).append(address)
+
+        collection = None
+        if ranking == "bm25":
+            futures = [self.shards[shard].submit(_shard_collection_stats, query, shard_addresses)
+                       for shard, shard_addresses in targets.items()]
+            collection = merge_collection_stats(future.result() for future in futures)
+
+        futures = [self.shards[shard].submit(_shard_search, query, top_k, ranking, shard_addresses, collection)
+                   for shard, shard_addresses in targets.items()]
+        hits: List[ShardHit] = []
+        total = 0
+        for future in futures:
+            shard_hits, count = future.result()
+            hits.extend(shard_hits)
+            total += count
+        return [(address, email, verdict) for _, address, _, email, verdict in _best_hits(hits, top_k)], total
+
+    def cpu_times(self) -> List[float]:
+        """CPU seconds spent so far by the worker process of every shard"""
+        return [shard.submit(time.process_time).result() for shard in self.shards]
+
+    def close(self):
+        for shard in self.shards:
+            shard.shutdown()
+
+    def __enter__(self) -> "ShardedEmailRegistry":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
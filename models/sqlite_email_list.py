@@ -0,0 +1,349 @@
+"""
+Persistent email lists stored in a local SQLite database.
+
+`SqliteEmailList` has the same interface as `EmailList`, so it can be put into `EmailRegistry` instead of it.
+Emails survive restarts, keyword search runs inside the database (with FTS5 index for BM25 ranking),
+and the database works in WAL mode, so readers from different threads don't block each other.
+Semantic search keeps embeddings in memory, they are computed for new rows on each semantic search.
+"""
+from models.email_list import HYBRID_KEYWORD_WEIGHT, RANKINGS, RECEIVED, SENT, next_version
+from models.injection_scanner import InjectionScanner, InjectionVerdict, default_injection_scanner
+from models.semantic_index import HashingEmbedder, SemanticIndex
+from typing import Dict, Iterable, List, Tuple
+import json
+import re
+import sqlite3
+import threading
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS emails (
+    id INTEGER PRIMARY KEY,
+    owner TEXT NOT NULL,
+    box INTEGER NOT NULL,
+    from_addr TEXT NOT NULL,
+    to_addr TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    injection_score REAL,
+    injection_labels TEXT,
+    injection_flagged INTEGER
+);
+CREATE INDEX IF NOT EXISTS emails_owner_box ON emails (owner, box, id);
+CREATE VIRTUAL TABLE IF NOT EXISTS emails_fts USING fts5 (
+    from_addr, subject, body, content='emails', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS emails_fts_insert AFTER INSERT ON emails BEGIN
+    INSERT INTO emails_fts (rowid, from_addr, subject, body) VALUES (new.id, new.from_addr, new.subject, new.body);
+END;
+"""
+
+EMAIL_COLUMNS = "from_addr, to_addr, subject, body"
+VERDICT_COLUMNS = "injection_score, injection_labels, injection_flagged"
+
+# Columns added after the first version of the schema: name -> type.
+MIGRATED_COLUMNS = {"injection_score": "REAL", "injection_labels": "TEXT", "injection_flagged": "INTEGER"}
+
+# BM25 weights of from_addr, subject and body columns, same as in `BM25Index`.
+BM25_WEIGHTS = (1.0, 2.0, 1.0)
+
+
+class SqliteEmailDatabase:
+    """SQLite database shared by all email lists"""
+
+    def __init__(self, path: str, batch_size: int = 1000, injection_scanner: InjectionScanner = default_injection_scanner):
+        self.path = path
+        self.batch_size = batch_size
+        # Received emails are scanned for prompt injections once, when they are inserted.
+        self.injection_scanner = injection_scanner
+        # Every thread reads through its own connection, writes are serialized with the lock.
+        self._local = threading.local()
+        self.write_lock = threading.Lock()
+
+        connection = self.connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+        existing_columns = {row[1] for row in connection.execute("PRAGMA table_info(emails)")}
+        for column, column_type in MIGRATED_COLUMNS.items():
+            if column not in existing_columns:
+                connection.execute(f"ALTER TABLE emails ADD COLUMN {column} {column_type}")
+
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def insert_emails(self, owner: str, box: int, emails: Iterable[Dict[str, str]]):
+        """Insert emails in batches, each batch is a single transaction"""
+        query = f"INSERT INTO emails (owner, box, {EMAIL_COLUMNS}, {VERDICT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        connection = self.connection()
+
+        batch = []
+        for email in emails:
+            verdict = (None, None, None)
+            if box == RECEIVED:
+                scanned = self.injection_scanner.scan(email)
+                verdict = (scanned.score, ",".join(scanned.labels), int(scanned.flagged))
+            batch.append((owner, box, email.get("from", ""), email.get("to", ""), email.get("subject", ""), email.get("body", ""), *verdict))
+            if len(batch) >= self.batch_size:
+                self._execute_batch(connection, query, batch)
+                batch = []
+        if batch:
+            self._execute_batch(connection, query, batch)
+
+    def _execute_batch(self, connection: sqlite3.Connection, query: str, batch: list):
+        with self.write_lock:
+            connection.execute("BEGIN")
+            try:
+                connection.executemany(query, batch)
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+
+def _row_to_email(row: tuple) -> Dict[str, str]:
+    return {"from": row[0], "to": row[1], "subject": row[2], "body": row[3]}
+
+
+def _row_to_verdict(row: tuple) -> InjectionVerdict | None:
+    score, labels, flagged = row[4:7]
+    if score is None:
+        return None
+    return InjectionVerdict(score, tuple(labels.split(",")) if labels else (), bool(flagged))
+
+
+def _fts_match(keywords: List[str]) -> str:
+    return " OR ".join(f'"{keyword}"' for keyword in set(keywords))
+
+
+def _count_score(keywords: List[str]) -> Tuple[str, tuple]:
+    """SQL expression with the number of non-overlapping occurrences of keywords (the same as `str.count`) and its params"""
+    text = "(from_addr || ' ' || subject || ' ' || body)"
+    occurrences = f"(length({text}) - length(replace({text}, ?, ''))) / length(?)"
+    return " + ".join([occurrences] * len(keywords)), tuple(param for keyword in keywords for param in (keyword, keyword))
+
+
+class SqliteEmailList:
+    def __init__(self, database: SqliteEmailDatabase, user_address: str, embedder=None):
+        self.database = database
+        self.user_address = user_address
+        # Embeddings of emails keyed by (box, id), rows with id up to the last embedded one are in the index.
+        self.embedder = embedder
+        self.semantic_index: SemanticIndex | None = None
+        self._last_embedded_id = 0
+        self._semantic_lock = threading.Lock()
+        # Grows on every change of the email list made through this object.
+        self.version = next_version()
+        # Versions of the sent and received lists, each grows only when its own list changes.
+        self.box_versions = [self.version, self.version]
+
+
+    def box_version(self, box: int) -> int:
+        """Version of the sent or received list, the UI compares it to skip re-rendering unchanged lists"""
+        return self.box_versions[box]
+
+
+    def __len__(self) -> int:
+        return self.database.connection().execute(
+            "SELECT COUNT(*) FROM emails WHERE owner = ?", (self.user_address,)
+        ).fetchone()[0]
+
+
+    def load_from_jsonl(self, filepath: str, lazy: bool = False):
+        """Load emails from JSONL file into the database (lazy mode is not needed here and is ignored)"""
+        try:
+            with open(filepath, "r") as f:
+                emails = (json.loads(line) for line in f if line.strip())
+                self.database.insert_emails(self.user_address, RECEIVED, emails)
+                self.version = self.box_versions[RECEIVED] = next_version()
+        except FileNotFoundError:
+            print(f"File {filepath} not found. Using empty email list.")
+
+
+    def _select(
+            self,
+            where: str = "",
+            params: tuple = (),
+            columns: str = EMAIL_COLUMNS,
+            limit: int = -1,
+            offset: int = 0,
+    ) -> List[tuple]:
+        return self.database.connection().execute(
+            f"SELECT {columns} FROM emails WHERE owner = ? {where} ORDER BY box, id LIMIT ? OFFSET ?",
+            (self.user_address, *params, limit, offset),
+        ).fetchall()
+
+
+    def _search_rows(self, query: str, top_k: int, ranking: str, columns: str, offset: int = 0) -> List[tuple]:
+        if ranking not in RANKINGS:
+            raise ValueError(f"Unknown ranking \"{ranking}\", expected one of: {', '.join(RANKINGS)}")
+
+        query_lower = query.lower()
+
+        if query_lower == 'all' or query_lower == 'all emails':
+            # Negative limit means no limit.
+            return self._select(columns=columns, limit=top_k, offset=offset)
+
+        keywords = re.findall(r"\w+", query_lower)
+        if not keywords or top_k <= 0:
+            return []
+
+        connection = self.database.connection()
+        if ranking in ("semantic", "hybrid"):
+            rows, _ = self._semantic_search_rows(query, keywords, top_k, ranking, columns, offset)
+            return rows
+
+        if ranking == "bm25":
+            # FTS5 returns negative bm25 scores, where lower is better.
+            qualified_columns = ", ".join(f"emails.{column.strip()}" for column in columns.split(","))
+            return connection.execute(
+                f"SELECT {qualified_columns} FROM emails_fts JOIN emails ON emails.id = emails_fts.rowid "
+                f"WHERE emails_fts MATCH ? AND emails.owner = ? "
+                f"ORDER BY bm25(emails_fts, ?, ?, ?), box, id LIMIT ? OFFSET ?",
+                (_fts_match(keywords), self.user_address, *BM25_WEIGHTS, top_k, offset),
+            ).fetchall()
+
+        score, params = _count_score(keywords)
+        return connection.execute(
+            f"SELECT {columns} FROM (SELECT *, {score} AS score FROM emails WHERE owner = ?) "
+            f"WHERE score > 0 ORDER BY score DESC, box, id LIMIT ? OFFSET ?",
+            (*params, self.user_address, top_k, offset),
+        ).fetchall()
+
+
+    def _semantic_search_rows(
+            self,
+            query: str,
+            keywords: List[str],
+            top_k: int,
+            ranking: str,
+            columns: str,
+            offset: int,
+    ) -> Tuple[List[tuple], int]:
+        """Rows of the most similar emails and total number of found emails, new rows are embedded first"""
+        connection = self.database.connection()
+        with self._semantic_lock:
+            if self.semantic_index is None:
+                self.semantic_index = SemanticIndex(self.embedder or HashingEmbedder())
+            rows = connection.execute(
+                "SELECT box, id, from_addr, subject, body FROM emails WHERE owner = ? AND id > ? ORDER BY id",
+                (self.user_address, self._last_embedded_id),
+            ).fetchall()
+            if rows:
+                self.semantic_index.add_many([(box, id) for box, id, *_ in rows], [" ".join(row[2:]) for row in rows])
+                self._last_embedded_id = rows[-1][1]
+
+            boosts = None
+            if ranking == "hybrid":
+                keyword_scores = connection.execute(
+                    "SELECT emails.box, emails.id, -bm25(emails_fts, ?, ?, ?) FROM emails_fts "
+                    "JOIN emails ON emails.id = emails_fts.rowid WHERE emails_fts MATCH ? AND emails.owner = ?",
+                    (*BM25_WEIGHTS, _fts_match(keywords), self.user_address),
+                ).fetchall()
+                max_score = max((score for *_, score in keyword_scores), default=0.0) or 1.0
+                boosts = {(box, id): HYBRID_KEYWORD_WEIGHT * score / max_score for box, id, score in keyword_scores}
+            keys, total = self.semantic_index.search(query, top_k, offset, boosts)
+
+        ids = [id for _, id in keys]
+        found = connection.execute(
+            f"SELECT id, {columns} FROM emails WHERE id IN ({', '.join('?' * len(ids))})", ids,
+        ).fetchall()
+        rows_by_id = {row[0]: row[1:] for row in found}
+        return [rows_by_id[id] for id in ids], total
+
+
+    def _count_found(self, query: str, ranking: str) -> int:
+        """Total number of emails found by the query"""
+        query_lower = query.lower()
+        if query_lower == 'all' or query_lower == 'all emails':
+            return len(self)
+
+        keywords = re.findall(r"\w+", query_lower)
+        if not keywords:
+            return 0
+
+        connection = self.database.connection()
+        if ranking == "bm25":
+            return connection.execute(
+                "SELECT COUNT(*) FROM emails_fts JOIN emails ON emails.id = emails_fts.rowid "
+                "WHERE emails_fts MATCH ? AND emails.owner = ?",
+                (_fts_match(keywords), self.user_address),
+            ).fetchone()[0]
+
+        score, params = _count_score(keywords)
+        return connection.execute(
+            f"SELECT COUNT(*) FROM emails WHERE owner = ? AND {score} > 0",
+            (self.user_address, *params),
+        ).fetchone()[0]
+
+
+    def keyword_search(self, query: str, top_k: int = 5, ranking: str = "count") -> List[Dict[str, str]]:
+        """Keyword-based search, which is executed by the database"""
+        query_lower = query.lower()
+        if query_lower == 'all' or query_lower == 'all emails':
+            top_k = -1
+        return [_row_to_email(row) for row in self._search_rows(query, top_k, ranking, EMAIL_COLUMNS)]
+
+
+    def search_with_verdicts(
+            self,
+            query: str,
+            top_k: int = 5,
+            ranking: str = "count",
+            offset: int = 0,
+    ) -> Tuple[List[Tuple[Dict[str, str], InjectionVerdict | None]], int]:
+        """Keyword-based search with pagination, returns a page of found emails with their verdicts and total number of found emails"""
+        columns = f"{EMAIL_COLUMNS}, {VERDICT_COLUMNS}"
+        query_lower = query.lower()
+        keywords = re.findall(r"\w+", query_lower)
+        if ranking in ("semantic", "hybrid") and keywords and top_k > 0 and query_lower not in ("all", "all emails"):
+            # Semantic index gives the total number of found emails together with the page.
+            rows, total = self._semantic_search_rows(query, keywords, top_k, ranking, columns, offset)
+        else:
+            rows = self._search_rows(query, top_k, ranking, columns, offset)
+            total = self._count_found(query, ranking)
+        return [(_row_to_email(row), _row_to_verdict(row)) for row in rows], total
+
+
+    def get_emails_page(self, box: int, offset: int, limit: int) -> Tuple[List[Dict[str, str]], int]:
+        """Emails of the sent or received list from offset to offset + limit and total number of emails in the list"""
+        rows = self._select("AND box = ?", (box,), limit=limit, offset=offset)
+        total = self.database.connection().execute(
+            "SELECT COUNT(*) FROM emails WHERE owner = ? AND box = ?", (self.user_address, box)
+        ).fetchone()[0]
+        return [_row_to_email(row) for row in rows], total
+
+
+    def add_sent_email(self, to_addr: str, subject: str, body: str):
+        """Add sent email to the sent list"""
+        email = {"from": self.user_address, "to": to_addr, "subject": subject, "body": body}
+        self.database.insert_emails(self.user_address, SENT, [email])
+        self.version = self.box_versions[SENT] = next_version()
+        return email
+
+
+    def get_sent_emails(self) -> List[Dict[str, str]]:
+        """Get all sent emails"""
+        return [_row_to_email(row) for row in self._select("AND box = ?", (SENT,))]
+
+
+    def add_received_email(self, from_addr: str, subject: str, body: str):
+        """Add a received email to the email list"""
+        email = {"from": from_addr, "to": self.user_address, "subject": subject, "body": body}
+        self.database.insert_emails(self.user_address, RECEIVED, [email])
+        self.version = self.box_versions[RECEIVED] = next_version()
+        return email
+
+
+    def get_received_emails(self) -> List[Dict[str, str]]:
+        """Get all received emails"""
+        return [_row_to_email(row) for row in self._select("AND box = ?", (RECEIVED,))]
+
+
+    def snapshot(self):
+        """Snapshots are taken of in-memory email lists, a database would need its own copy-on-write layer"""
+        raise NotImplementedError("Snapshots are supported only by in-memory email lists ('list' / 'compact' storage)")
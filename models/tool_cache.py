@@ -0,0 +1,67 @@
+"""
+Cache of tool outputs.
+
+Agents often call `find_emails` with the same query several times during a run.
+Outputs are cached together with the version of the email list they were built from,
+so any change of the email list makes its cached outputs stale.
+"""
+from models.email_list import KEYWORD_RANKINGS
+from collections import OrderedDict
+from typing import Dict, Hashable, Tuple
+import re
+import threading
+
+
+def normalize_query(query: str, ranking: str = "count") -> str:
+    """Normalize search query, so equivalent queries share the cache entry"""
+    query_lower = query.lower()
+    # Keep "show all" queries apart from keyword queries with the same words.
+    if query_lower == 'all' or query_lower == 'all emails':
+        return "\0all"
+    if ranking in KEYWORD_RANKINGS:
+        # Order of keywords does not change the search results.
+        return " ".join(sorted(re.findall(r"\w+", query_lower)))
+    # Semantic rankings embed the query as it is, and embeddings of a model depend on the order and case of words.
+    return " ".join(query.split())
+
+
+class ToolResultCache:
+    """Thread-safe LRU cache of tool outputs with version-based invalidation"""
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._entries: OrderedDict[Hashable, Tuple[int, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, version: int) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, version: int, output: str):
+        with self._lock:
+            self._entries[key] = (version, output)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / requests if requests else 0.0,
+                "size": len(self._entries),
+            }
+
+
+# Outputs of `find_emails` tool, shared by all agents.
+find_emails_cache = ToolResultCache()
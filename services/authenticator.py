@@ -1,3 +1,12 @@
+"""
+Signatures of prompts and tool outputs (A - Authenticated Prompts).
+
+The secret is turned into a keyed HMAC state once, every signature starts from a copy of it,
+so neither the secret nor the HMAC key schedule is processed again per message.
+Long texts are encoded and hashed in chunks, so signing never makes a full byte copy of a large tool output.
+"""
+from services.metrics import metrics
+from typing import Iterable
 import hashlib
 import hmac
 import os
@@ -5,13 +14,61 @@ import os
 
 PROMPT_SIGN_SECRET = os.getenv("PROMPT_SIGN_SECRET")
 
+# Length of signatures in hex characters.
+SIGNATURE_LENGTH = 16
+
+# Characters of text encoded and hashed at once.
+SIGN_CHUNK_CHARS = 64 * 1024
+
+# Length of signatures in boundary tags, shorter signatures are never accepted.
+TAG_SIGNATURE_LENGTH = 8
+
+# Keyed HMAC state, every signature starts from a copy of it, None if the secret is not set.
+_keyed_hmac = hmac.new(PROMPT_SIGN_SECRET.encode(), digestmod=hashlib.sha256) if PROMPT_SIGN_SECRET is not None else None
+
+
+def _new_hmac():
+    if _keyed_hmac is None:
+        raise ValueError("PROMPT_SIGN_SECRET env is not set")
+    return _keyed_hmac.copy()
+
 
+def _sign_parts(parts: Iterable[str | bytes]) -> str:
+    """Signature of the concatenation of parts"""
+    signer = _new_hmac()
+    for part in parts:
+        if isinstance(part, str):
+            if len(part) <= SIGN_CHUNK_CHARS:
+                signer.update(part.encode())
+            else:
+                for start in range(0, len(part), SIGN_CHUNK_CHARS):
+                    signer.update(part[start:start + SIGN_CHUNK_CHARS].encode())
+        else:
+            signer.update(part)
+    return signer.hexdigest()[:SIGNATURE_LENGTH]
+
+
+@metrics.timed("sign_message")
 def sign_message(prompt):
     """Creates cryptographic sign for message"""
-    return hmac.new(PROMPT_SIGN_SECRET.encode(), prompt.encode(), hashlib.sha256).hexdigest()[:16]
+    return _sign_parts((prompt,))
 
 
+@metrics.timed("verify_sign")
 def verify_sign(prompt, signature):
     """Verifies cryptographic sign for message"""
-    expected_signature = sign_message(prompt)
+    expected_signature = _sign_parts((prompt,))
     return hmac.compare_digest(expected_signature, signature)
+
+
+@metrics.timed("sign_tool_output")
+def sign_tool_output(tool_name: str, output: str) -> str:
+    """Creates cryptographic sign for output of the tool, it never equals the sign of a prompt with the same text"""
+    return _sign_parts((b"tool\0", tool_name, b"\0", output))
+
+
+def verify_tool_output(tool_name: str, output: str, signature: str) -> bool:
+    """Verifies cryptographic sign for output of the tool, it may be shortened as in boundary tags"""
+    if len(signature) < TAG_SIGNATURE_LENGTH:
+        return False
+    return hmac.compare_digest(sign_tool_output(tool_name, output)[:len(signature)], signature)
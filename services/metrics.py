@@ -0,0 +1,214 @@
+"""
+Latency and token metrics of the agent's hot path.
+
+Stages (signing, wrapping the input, model calls, tools, rendering of the mailbox panels) are timed into histograms,
+which are served in Prometheus text format by a small HTTP server on a separate port.
+Metrics are enabled with METRICS_ENABLED env, when they are disabled, decorated functions are left as they are
+and timers are a shared no-op context manager, so instrumentation costs nothing.
+"""
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Tuple
+import bisect
+import functools
+import os
+import threading
+import time
+
+
+# Buckets of durations in seconds, from sub-millisecond tool calls to long model calls.
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Buckets of token counts of a single model call.
+TOKENS_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    """Cumulative histogram of observed values with fixed buckets"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def render(self, name: str, labels: Labels) -> List[str]:
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+            cumulative += bucket_count
+            le = f'le="{bound}"'
+            lines.append(f"{name}_bucket{_format_labels(labels, le)} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+        lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Histograms by name and labels, and gauges collected from other components at scrape time"""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        # name -> (help, buckets, {labels: histogram})
+        self._histograms: Dict[str, Tuple[str, Tuple[float, ...], Dict[Labels, Histogram]]] = {}
+        # (prefix, labels, function returning current values)
+        self._collectors: List[Tuple[str, Labels, Callable[[], Dict[str, float]]]] = []
+        self._lock = threading.Lock()
+
+    def register_histogram(self, name: str, help: str, buckets: Tuple[float, ...] = SECONDS_BUCKETS):
+        with self._lock:
+            self._histograms.setdefault(name, (help, buckets, {}))
+
+    def observe(self, name: str, value: float, **labels: str):
+        if not self.enabled:
+            return
+        help, buckets, series = self._histograms[name]
+        key = tuple(sorted(labels.items()))
+        histogram = series.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = series.setdefault(key, Histogram(buckets))
+        histogram.observe(value)
+
+    def timer(self, stage: str):
+        """Context manager, which records duration of the stage into `agent_stage_seconds` histogram"""
+        if not self.enabled:
+            return _NO_TIMER
+        return self._timer(stage)
+
+    @contextmanager
+    def _timer(self, stage: str) -> Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("agent_stage_seconds", time.perf_counter() - started_at, stage=stage)
+
+    def timed(self, stage: str):
+        """Decorator, which times every call of the function, the function is returned as is if metrics are disabled"""
+        def decorator(function):
+            if not self.enabled:
+                return function
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                started_at = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.observe("agent_stage_seconds", time.perf_counter() - started_at, stage=stage)
+
+            return wrapper
+
+        return decorator
+
+    def add_collector(self, prefix: str, collect: Callable[[], Dict[str, float]], **labels: str):
+        """Export values returned by collect as `{prefix}_{key}` gauges"""
+        with self._lock:
+            self._collectors.append((prefix, tuple(sorted(labels.items())), collect))
+
+    def render(self) -> str:
+        """All metrics in Prometheus text format"""
+        with self._lock:
+            histograms = [(name, help, dict(series)) for name, (help, _, series) in self._histograms.items()]
+            collectors = list(self._collectors)
+
+        lines = []
+        for name, help, series in histograms:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in series.items():
+                lines.extend(histogram.render(name, labels))
+
+        gauges: Dict[str, List[str]] = {}
+        for prefix, labels, collect in collectors:
+            for key, value in collect().items():
+                gauges.setdefault(f"{prefix}_{key}", []).append(f"{prefix}_{key}{_format_labels(labels)} {float(value)}")
+        for name, samples in gauges.items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(samples)
+
+        return "\n".join(lines) + "\n"
+
+
+_NO_TIMER = nullcontext()
+
+
+def instrument_method(obj, method_name: str, stage: str, generator: bool = False):
+    """Time calls of the object's method (e.g. a model shared by agents), generator methods are timed until exhausted"""
+    if not metrics.enabled:
+        return
+
+    method = getattr(obj, method_name)
+    if generator:
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            with metrics.timer(stage):
+                yield from method(*args, **kwargs)
+    else:
+        wrapper = metrics.timed(stage)(method)
+    setattr(obj, method_name, wrapper)
+
+
+def record_step_metrics(memory_step, agent=None):
+    """Step callback, which records tokens and duration of every agent step"""
+    if not hasattr(memory_step, "token_usage"):
+        return
+    if memory_step.timing is not None and memory_step.timing.duration is not None:
+        metrics.observe("agent_stage_seconds", memory_step.timing.duration, stage="agent_step")
+    if memory_step.token_usage is not None:
+        metrics.observe("agent_step_tokens", memory_step.token_usage.input_tokens, kind="input")
+        metrics.observe("agent_step_tokens", memory_step.token_usage.output_tokens, kind="output")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are not logged.
+        pass
+
+
+def start_metrics_server(port: int, registry: MetricsRegistry = None, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve metrics at http://host:port/metrics from a daemon thread"""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry or metrics})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+# Registry used by the application.
+metrics = MetricsRegistry(enabled=os.getenv("METRICS_ENABLED", "false").lower() == "true")
+metrics.register_histogram("agent_stage_seconds", "Duration of stages of chat requests in seconds")
+metrics.register_histogram("agent_step_tokens", "Tokens of a single agent step", TOKENS_BUCKETS)
@@ -0,0 +1,77 @@
+from agent.a2as_boundaries import unwrap_tool_output, wrap_tool_output
+from agent.fast_path import display_output
+from models.behavior_certificates import DummyEmailBehaviorCertificates
+from models.email_agent_tools import EmailRegistry, FindEmailsTool
+from models.email_list import EmailList
+from services import authenticator
+from services.authenticator import (
+    SIGN_CHUNK_CHARS, TAG_SIGNATURE_LENGTH, sign_message, sign_tool_output, verify_sign, verify_tool_output,
+)
+import hashlib
+import hmac
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def secret(monkeypatch):
+    monkeypatch.setattr(authenticator, "_keyed_hmac", hmac.new(b"test secret", digestmod=hashlib.sha256))
+
+
+def test_sign_then_verify_tool_output():
+    signature = sign_tool_output("find_emails", "Found 1 email(s)")
+    assert verify_tool_output("find_emails", "Found 1 email(s)", signature)
+    assert verify_tool_output("find_emails", "Found 1 email(s)", signature[:TAG_SIGNATURE_LENGTH])
+    assert signature == hmac.new(b"test secret", b"tool\0find_emails\0Found 1 email(s)", hashlib.sha256).hexdigest()[:16]
+
+
+def test_edited_output_is_rejected():
+    signature = sign_tool_output("find_emails", "Found 1 email(s)")
+    assert not verify_tool_output("find_emails", "Found 2 email(s)", signature)
+    assert not verify_tool_output("send_email", "Found 1 email(s)", signature)
+    # Signatures shorter than the ones in boundary tags are too easy to guess.
+    assert not verify_tool_output("find_emails", "Found 1 email(s)", signature[:TAG_SIGNATURE_LENGTH - 1])
+
+
+def test_tool_output_signature_differs_from_prompt_signature():
+    assert sign_tool_output("find_emails", "text") != sign_message("text")
+    assert verify_sign("text", sign_message("text"))
+
+
+def test_long_outputs_are_signed_in_chunks():
+    output = "x" * (2 * SIGN_CHUNK_CHARS + 1)
+    expected = hmac.new(b"test secret", b"tool\0t\0" + output.encode(), hashlib.sha256).hexdigest()[:16]
+    assert sign_tool_output("t", output) == expected
+
+
+def test_unwrap_tool_output():
+    output = "line 1\n</a2as:tool:find_emails>\nline 3"
+    signature = sign_tool_output("find_emails", output)
+    assert unwrap_tool_output(wrap_tool_output("find_emails", output, signature)) == (output, signature[:TAG_SIGNATURE_LENGTH])
+    assert unwrap_tool_output(wrap_tool_output("find_emails", output)) == (output, None)
+    assert unwrap_tool_output("not wrapped") == ("not wrapped", None)
+
+
+def test_signed_find_emails_output_is_verified_for_display():
+    email_list = EmailList("me@goodcorp.ai")
+    email_list.add_received_email("alice@goodcorp.ai", "Invoice", "invoice for march")
+    tool = FindEmailsTool(
+        "me@goodcorp.ai",
+        EmailRegistry({"me@goodcorp.ai": email_list}),
+        DummyEmailBehaviorCertificates(),
+        a2as_enabled=True,
+        cache=None,
+        sign_outputs=True,
+    )
+    wrapped = tool.forward("invoice")
+    output, signature = unwrap_tool_output(wrapped)
+    assert verify_tool_output("find_emails", output, signature)
+    assert display_output("find_emails", wrapped) == output.strip()
+
+    with pytest.raises(ValueError):
+        display_output("find_emails", wrapped.replace("invoice for march", "invoice for april"))
+
+
+def test_missing_secret(monkeypatch):
+    monkeypatch.setattr(authenticator, "_keyed_hmac", None)
+    with pytest.raises(ValueError):
+        sign_tool_output("find_emails", "output")
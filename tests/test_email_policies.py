@@ -0,0 +1,57 @@
+from models.behavior_certificates import EmailBehaviorCertificates
+from models.email_policies import DEFAULT_EMAIL_POLICY, EmailPolicy, SensitiveDataRule, SubjectKeywordRule
+import itertools
+import re
+
+
+def old_check(to_addr: str, subject: str, body: str) -> tuple[bool, str]:
+    """Checks of `EmailBehaviorCertificates` before they were moved to the declarative policy"""
+    if not to_addr.endswith("@goodcorp.ai"):
+        return False, "Sending emails to non-corporate addresses is prohibited"
+    if "confidential" in subject.lower() or "corporate" in subject.lower():
+        return False, "You can't send this email because it has label \"Confidential\" or \"Corporate\" in its subject"
+    if 'token' in body and re.findall(r"\d{3}-\d{2}", body):
+        return False, "You can't send this email because it contains token data, which is sensitive information"
+    return True, ""
+
+
+ADDRESSES = ["bob@goodcorp.ai", "bob@evil.com", "bob@goodcorp.ai.evil.com", "BOB@GOODCORP.AI"]
+SUBJECTS = ["Lunch", "CONFIDENTIAL report", "Corporate news", "Non-corporate", "confidentiality", ""]
+BODIES = [
+    "See you at noon",
+    "Your token is 123-45",
+    "Token 123-45",
+    "token without numbers 12-345",
+    "tokens: 1234-567",
+    "call 555-12 about it",
+    "",
+]
+
+
+def test_default_policy_matches_old_checks():
+    certificates = EmailBehaviorCertificates()
+    for to_addr, subject, body in itertools.product(ADDRESSES, SUBJECTS, BODIES):
+        assert certificates.check_right_to_send_email(to_addr, subject, body) == old_check(to_addr, subject, body)
+
+
+def test_batch_check_matches_single_checks():
+    emails = list(itertools.product(ADDRESSES, SUBJECTS, BODIES))
+    assert DEFAULT_EMAIL_POLICY.check_batch(emails) == [DEFAULT_EMAIL_POLICY.check(*email) for email in emails]
+
+
+def test_first_violated_subject_rule_is_reported():
+    policy = EmailPolicy([SubjectKeywordRule(["draft"], "draft"), SubjectKeywordRule(["secret"], "secret")])
+    assert policy.check("a@goodcorp.ai", "Secret plan", "") == (False, "secret")
+    assert policy.check("a@goodcorp.ai", "Draft of the plan", "") == (False, "draft")
+    assert policy.check("a@goodcorp.ai", "Plan", "") == (True, "")
+
+
+def test_inactive_rules_do_not_hide_active_ones():
+    policy = EmailPolicy([
+        SensitiveDataRule(r"\d{3}-\d{2}-\d{4}", "ssn", required_word="ssn"),
+        SensitiveDataRule(r"\d{3}-\d{2}", "token", required_word="token"),
+    ])
+    # The first rule's pattern would match at the same position, but its word is missing in the body.
+    assert policy.check("a@goodcorp.ai", "Hi", "token 123-45-6789") == (False, "token")
+    assert policy.check("a@goodcorp.ai", "Hi", "ssn token 123-45-6789") == (False, "ssn")
+    assert policy.check("a@goodcorp.ai", "Hi", "ssn 123-45") == (True, "")
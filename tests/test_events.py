@@ -0,0 +1,57 @@
+from agent.events import AgentEventLog, record_step_events, time_tool_calls
+from smolagents import ChatMessage, Model, ToolCallingAgent, tool
+from smolagents.models import ChatMessageToolCall, ChatMessageToolCallFunction
+from ui.loggers import GradioConsoleLogger
+import pytest
+import time
+
+
+@tool
+def slow_tool(text: str) -> str:
+    """
+    Returns the text after a delay
+
+    Args:
+        text: Text to return
+    """
+    time.sleep(0.2)
+    return text
+
+
+class SlowModel(Model):
+    """Calls slow_tool on the first step and gives the final answer on the second one"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def generate(self, messages, **kwargs) -> ChatMessage:
+        time.sleep(0.05)
+        self.calls += 1
+        name, arguments = ("slow_tool", {"text": "hi"}) if self.calls == 1 else ("final_answer", {"answer": "done"})
+        function = ChatMessageToolCallFunction(name=name, arguments=arguments)
+        return ChatMessage(
+            role="assistant",
+            content=None,
+            tool_calls=[ChatMessageToolCall(id=str(self.calls), type="function", function=function)],
+        )
+
+
+def test_model_and_tool_calls_are_timed_separately():
+    agent = ToolCallingAgent(tools=[slow_tool], model=SlowModel(), step_callbacks=[record_step_events], verbosity_level=0)
+    time_tool_calls(agent)
+    agent.event_log = AgentEventLog("session")
+
+    assert agent.run("Say hi") == "done"
+
+    events = [(event.kind, event.tool_name) for event in agent.event_log.snapshot()]
+    assert events == [("model_call", None), ("tool_call", "slow_tool"), ("model_call", None), ("final_answer", "final_answer")]
+    first_model_call, tool_call = agent.event_log.snapshot()[:2]
+    assert 0.05 <= first_model_call.duration < 0.2
+    assert tool_call.duration >= 0.2
+    assert not agent.tool_timings
+
+
+def test_console_logger_rejects_non_positive_limit():
+    with pytest.raises(ValueError):
+        GradioConsoleLogger(max_chars=0, tee=False)
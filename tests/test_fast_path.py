@@ -0,0 +1,40 @@
+from agent.fast_path import match_request
+import pytest
+
+
+@pytest.mark.parametrize("message", [
+    "show all emails",
+    "Show me all my e-mails please.",
+    "  list all messages!  ",
+    "get all of my mails",
+])
+def test_show_all_requests(message):
+    assert match_request(message) == ("find_emails", {"query": "all emails"})
+
+
+@pytest.mark.parametrize("message, to_address, subject, body", [
+    ('send email to bob@goodcorp.ai with subject "Lunch" and body "See you at noon"', "bob@goodcorp.ai", "Lunch", "See you at noon"),
+    ("Please send an e-mail to bob.smith@mail.goodcorp.ai with the subject 'Hi' and the body 'Hello!'.", "bob.smith@mail.goodcorp.ai", "Hi", "Hello!"),
+    ('send a message to bob@goodcorp.ai with subject "" and body "Line 1\nLine 2"', "bob@goodcorp.ai", "", "Line 1\nLine 2"),
+    ('send email to bob@goodcorp.ai with subject "Plan" and body "Don\'t forget the \'draft\'"', "bob@goodcorp.ai", "Plan", "Don't forget the 'draft'"),
+    ('send email to bob@goodcorp.ai with subject "a and body b" and body "c"', "bob@goodcorp.ai", "a and body b", "c"),
+])
+def test_send_email_requests(message, to_address, subject, body):
+    assert match_request(message) == ("send_email", {"to_address": to_address, "subject": subject, "body": body})
+
+
+@pytest.mark.parametrize("message", [
+    # Ambiguous: quotes inside the quoted fields.
+    'send email to bob@goodcorp.ai with subject "a" and body "b" and body "c"',
+    'send email to bob@goodcorp.ai with subject "a" and subject "b" and body "c"',
+    "send email to bob@goodcorp.ai with subject 'a' and body 'it's late'",
+    # Unquoted fields, missing parts, invalid address and extra requests need the model.
+    "send email to bob@goodcorp.ai with subject Lunch and body See you",
+    'send email to bob@goodcorp.ai with subject "Lunch"',
+    'send email to bob with subject "Lunch" and body "See you"',
+    'send email to bob@goodcorp.ai with subject "Lunch" and body "See you" and then show all emails',
+    "show all emails from alice",
+    "what emails did I get today?",
+])
+def test_other_requests_go_to_the_model(message):
+    assert match_request(message) is None
@@ -0,0 +1,100 @@
+from models.behavior_certificates import DummyEmailBehaviorCertificates
+from models.email_agent_tools import (
+    FIND_EMAILS_MAX_OUTPUT_CHARS, FIND_EMAILS_TOP_K, MAX_SUBJECT_CHARS, EmailRegistry, FindEmailsTool, make_snippet, split_budget,
+)
+from models.email_list import EmailList
+import re
+
+
+USER = "me@goodcorp.ai"
+
+
+def make_tool(emails_count: int, body: str = "weekly report", **kwargs) -> FindEmailsTool:
+    email_list = EmailList(USER)
+    for i in range(emails_count):
+        email_list.add_received_email(f"sender{i}@goodcorp.ai", f"Report {i}", body)
+    return FindEmailsTool(USER, EmailRegistry({USER: email_list}), DummyEmailBehaviorCertificates(), cache=None, **kwargs)
+
+
+def subjects(output: str):
+    return re.findall(r"Subject: (.*)", output)
+
+
+def test_pages():
+    tool = make_tool(FIND_EMAILS_TOP_K + 5)
+
+    first = tool.forward("report")
+    assert first.startswith(f"Found {FIND_EMAILS_TOP_K + 5} email(s) in the email list, showing emails 1-{FIND_EMAILS_TOP_K}:")
+    assert subjects(first) == [f"Report {i}" for i in range(FIND_EMAILS_TOP_K)]
+    assert "call find_emails with the same query and page=2" in first
+
+    second = tool.forward("report", page=2)
+    assert subjects(second) == [f"Report {i}" for i in range(FIND_EMAILS_TOP_K, FIND_EMAILS_TOP_K + 5)]
+    assert "page=3" not in second
+
+    assert tool.forward("report", page=3) == (
+        f"No more emails found, all {FIND_EMAILS_TOP_K + 5} email(s) matching your query are on the previous pages."
+    )
+    assert tool.forward("report", page=0) == first
+
+
+def test_all_emails_query_is_paged():
+    tool = make_tool(FIND_EMAILS_TOP_K + 1)
+    assert len(subjects(tool.forward("all emails"))) == FIND_EMAILS_TOP_K
+    assert subjects(tool.forward("all emails", page=2)) == [f"Report {FIND_EMAILS_TOP_K}"]
+
+
+def test_output_fits_budget():
+    body = "lorem ipsum " * 500 + "the quarterly report is attached " + "dolor sit amet " * 500
+    tool = make_tool(FIND_EMAILS_TOP_K, body=body, max_output_chars=6000)
+
+    output = tool.forward("quarterly")
+    assert len(output) <= 6000
+    # Snippets are cut around the matched keyword.
+    assert output.count("the quarterly report is attached") == FIND_EMAILS_TOP_K
+
+
+def test_single_long_email_is_returned_whole():
+    body = "the quarterly report " + "x" * 2200
+    output = make_tool(1, body=body).forward("quarterly")
+    assert f"Body: {body}\n" in output
+    assert len(output) <= FIND_EMAILS_MAX_OUTPUT_CHARS
+
+
+def test_short_bodies_leave_budget_to_long_ones():
+    email_list = EmailList(USER)
+    for i in range(5):
+        email_list.add_received_email(f"sender{i}@goodcorp.ai", "Report", "short report")
+    long_body = "report " + "y" * 5000
+    email_list.add_received_email("long@goodcorp.ai", "Report", long_body)
+    tool = FindEmailsTool(USER, EmailRegistry({USER: email_list}), DummyEmailBehaviorCertificates(), cache=None, max_output_chars=4000)
+
+    output = tool.forward("report")
+    assert len(output) <= 4000
+    assert output.count("Body: short report\n") == 5
+    # The long body gets nearly all of the budget, not a sixth of it.
+    long_snippet = re.search(r"Body: (report y+\.\.\.)\n", output).group(1)
+    assert len(long_snippet) > 2500
+
+
+def test_long_subjects_are_cut():
+    email_list = EmailList(USER)
+    email_list.add_received_email("alice@goodcorp.ai", "s" * 5000 + " report", "report")
+    tool = FindEmailsTool(USER, EmailRegistry({USER: email_list}), DummyEmailBehaviorCertificates(), cache=None)
+    subject = subjects(tool.forward("report"))[0]
+    assert subject.endswith(" report") and len(subject) <= MAX_SUBJECT_CHARS + len("...")
+
+
+def test_split_budget():
+    assert split_budget([10, 20], 100, 5) == 20
+    assert split_budget([10, 100, 100], 100, 5) == 45
+    assert split_budget([100, 100], 10, 20) == 20
+    assert split_budget([], 100, 5) == 5
+
+
+def test_make_snippet():
+    text = "a" * 100 + "keyword" + "b" * 100
+    assert make_snippet(text, ["keyword"], 1000) == text
+    snippet = make_snippet(text, ["KEYWORD"], 30)
+    assert snippet == "..." + "a" * 10 + "keyword" + "b" * 13 + "..."
+    assert make_snippet(text, [], 10) == "a" * 10 + "..."
@@ -0,0 +1,51 @@
+from models.email_list import EmailList, RECEIVED, SENT
+from ui.formatters import EmailsRenderCache, escape_markdown, format_emails_list
+
+
+def make_email_list(storage: str = "list") -> EmailList:
+    email_list = EmailList("me@goodcorp.ai", storage=storage)
+    for i in range(3):
+        email_list.add_received_email(f"sender{i}@goodcorp.ai", f"Subject {i}", f"Body {i}")
+    return email_list
+
+
+def test_escape_markdown():
+    assert escape_markdown("*bold*\n[link](url)") == "\\*bold\\* \\[link\\]\\(url\\)"
+    assert escape_markdown("") == ""
+
+
+def test_pages_are_rendered_like_full_list():
+    email_list = make_email_list()
+    output, page = EmailsRenderCache().render_page(email_list, RECEIVED, 1, 2)
+    assert page == 1
+    assert output == "*Page 1 of 2, 3 email(s)*\n\n" + format_emails_list(email_list.get_received_emails()[:2])
+
+
+def test_out_of_range_page_is_clamped():
+    cache = EmailsRenderCache()
+    output, page = cache.render_page(make_email_list(), RECEIVED, 5, 2)
+    assert page == 2
+    assert "Subject 2" in output and "Subject 0" not in output
+    assert cache.render_page(make_email_list(), SENT, 1, 2) == ("No emails", 1)
+
+
+def test_page_is_rerendered_when_email_is_added():
+    cache = EmailsRenderCache()
+    email_list = make_email_list("compact")
+    cache.render_page(email_list, RECEIVED, 1, 5)
+    email_list.add_received_email("new@goodcorp.ai", "New", "New body")
+    output, _ = cache.render_page(email_list, RECEIVED, 1, 5)
+    assert "4 email(s)" in output and "New body" in output
+
+
+def test_rolled_back_snapshot_shows_its_new_emails():
+    cache = EmailsRenderCache()
+    snapshot = make_email_list().snapshot()
+    snapshot.add_received_email("old@goodcorp.ai", "Old", "Dropped on rollback")
+    assert "Dropped on rollback" in cache.render_page(snapshot, RECEIVED, 1, 5)[0]
+
+    snapshot.rollback()
+    snapshot.add_received_email("new@goodcorp.ai", "New", "Added after rollback")
+    output, _ = cache.render_page(snapshot, RECEIVED, 1, 5)
+    assert "Added after rollback" in output
+    assert "Dropped on rollback" not in output
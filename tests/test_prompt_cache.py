@@ -0,0 +1,65 @@
+from agent.prompt_cache import PromptCacheStats, StreamUsageTracker
+from smolagents import LiteLLMModel, ToolCallingAgent
+from types import SimpleNamespace
+
+
+def tool_call_chunk(arguments: str, index: int = 0):
+    function = SimpleNamespace(name="final_answer", arguments=arguments)
+    tool_call = SimpleNamespace(index=index, id="call_0", type="function", function=function)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None, tool_calls=[tool_call]))], usage=None)
+
+
+def usage_chunk(prompt_tokens: int, cached_tokens: int):
+    usage = SimpleNamespace(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=5,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=cached_tokens),
+    )
+    return SimpleNamespace(choices=[], usage=usage)
+
+
+class FakeLiteLLM:
+    """Streams a final answer the way litellm does, with usage in the last chunk"""
+
+    def __init__(self):
+        self.calls = []
+
+    def completion(self, **kwargs):
+        self.calls.append(kwargs)
+        assert kwargs["stream"] and kwargs["stream_options"] == {"include_usage": True}
+        return iter([
+            tool_call_chunk('{"answer": '),
+            tool_call_chunk('"done"}'),
+            usage_chunk(prompt_tokens=120, cached_tokens=100),
+        ])
+
+
+def test_streamed_step_reports_cached_tokens():
+    client = FakeLiteLLM()
+    model = LiteLLMModel(model_id="openai/test", client=client)
+    tracker = StreamUsageTracker()
+    tracker.instrument(model, "completion")
+    stats = PromptCacheStats(stream_usage=tracker)
+    agent = ToolCallingAgent(tools=[], model=model, stream_outputs=True, step_callbacks=[stats], verbosity_level=0)
+
+    assert agent.run("Say done") == "done"
+
+    assert len(client.calls) == 1
+    assert stats.summary() == {
+        "steps": 1,
+        "prompt_tokens": 120,
+        "cached_tokens": 100,
+        "uncached_tokens": 20,
+        "cache_hit_ratio": 100 / 120,
+    }
+    # The usage is taken by the callback, nothing is left for later steps.
+    assert not tracker._usage
+
+
+def test_usage_is_kept_per_input_messages():
+    tracker = StreamUsageTracker(size=1)
+    first, second = [], []
+    tracker._usage[id(first)] = (first, "first usage")
+    assert tracker.pop(second) is None
+    assert tracker.pop(first) == "first usage"
+    assert tracker.pop(first) is None
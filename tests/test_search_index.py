@@ -0,0 +1,120 @@
+from models import search_index
+from models.email_list import EmailList, RECEIVED, SENT
+from models.search_index import InvertedIndex, email_text, top_k_keys
+import re
+
+
+EMAILS = [
+    {"from": "alice@goodcorp.ai", "subject": "Budget review", "body": "The budget for Q3 is ready, see budgets.xlsx"},
+    {"from": "bob@goodcorp.ai", "subject": "Lunch", "body": "Lunch at noon? Bring the Budget notes"},
+    {"from": "carol@example.com", "subject": "budget", "body": "budget budget"},
+    {"from": "dave@example.com", "subject": "Holidays", "body": "Office is closed on Monday"},
+]
+
+
+def naive_scores(emails, query):
+    """Scores of the original keyword search, which counted keywords in the text of every email"""
+    keywords = re.findall(r"\w+", query.lower())
+    scores = {}
+    for position, email in enumerate(emails):
+        score = sum(email_text(email).count(keyword) for keyword in keywords)
+        if score > 0:
+            scores[(RECEIVED, position)] = score
+    return scores
+
+
+def build_index(emails):
+    index = InvertedIndex()
+    for position, email in enumerate(emails):
+        index.add((RECEIVED, position), email)
+    return index
+
+
+def test_count_scores_match_naive_counting():
+    index = build_index(EMAILS)
+    for query in ["budget", "budget lunch", "goodcorp", "the", "o", "missing"]:
+        keywords = re.findall(r"\w+", query.lower())
+        assert index.score(keywords) == naive_scores(EMAILS, query)
+
+
+def test_ties_are_resolved_in_favour_of_earlier_emails():
+    scores = {(RECEIVED, 2): 1, (SENT, 5): 1, (RECEIVED, 0): 3, (RECEIVED, 1): 1}
+    assert top_k_keys(scores, 3) == [(RECEIVED, 0), (SENT, 5), (RECEIVED, 1)]
+
+    emails = EmailList("me@goodcorp.ai")
+    for i in range(3):
+        emails.add_received_email("x@example.com", f"Report {i}", "quarterly report")
+    assert [email["subject"] for email in emails.keyword_search("report", top_k=3)] == ["Report 0", "Report 1", "Report 2"]
+
+
+def test_matches_cache_is_updated_when_emails_are_added():
+    index = build_index(EMAILS[:2])
+    assert index.score(["budget"]) == {(RECEIVED, 0): 2}
+
+    index.add((RECEIVED, 2), EMAILS[2])
+    index.add((RECEIVED, 3), {"from": "erin@example.com", "subject": "re", "body": "nobudget"})
+    assert index.score(["budget"]) == {(RECEIVED, 0): 2, (RECEIVED, 2): 3, (RECEIVED, 3): 1}
+    assert index._matches_cache["budget"] == (len(index.vocabulary), ["budget", "budgets", "nobudget"])
+
+
+def test_email_list_finds_emails_added_after_search():
+    emails = EmailList("me@goodcorp.ai")
+    emails.add_received_email("alice@goodcorp.ai", "Invoice", "Invoice attached")
+    assert len(emails.keyword_search("contract")) == 0
+
+    emails.add_sent_email("bob@goodcorp.ai", "Contract", "Signed contract")
+    assert [email["subject"] for email in emails.keyword_search("contract")] == ["Contract"]
+
+
+def test_matches_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(search_index, "MATCHES_CACHE_SIZE", 2)
+    index = build_index(EMAILS)
+    for keyword in ["budget", "lunch", "budget", "office"]:
+        index.score([keyword])
+    assert list(index._matches_cache) == ["budget", "office"]
+
+
+def test_bm25_weights_subject_matches_higher():
+    emails = EmailList("me@goodcorp.ai")
+    emails.add_received_email("alice@goodcorp.ai", "Weekly notes", "notes about the invoice")
+    emails.add_received_email("bob@goodcorp.ai", "Invoice", "see the attached notes")
+    found = emails.keyword_search("invoice", ranking="bm25")
+    assert [email["from"] for email in found] == ["bob@goodcorp.ai", "alice@goodcorp.ai"]
+
+
+def test_bm25_long_bodies_do_not_dominate():
+    emails = EmailList("me@goodcorp.ai")
+    emails.add_received_email("alice@goodcorp.ai", "Newsletter", "invoice invoice " + "filler " * 300)
+    emails.add_received_email("bob@goodcorp.ai", "Payment", "invoice paid")
+    assert emails.keyword_search("invoice", top_k=1, ranking="count")[0]["from"] == "alice@goodcorp.ai"
+    assert emails.keyword_search("invoice", top_k=1, ranking="bm25")[0]["from"] == "bob@goodcorp.ai"
+
+
+def test_bm25_ties_are_resolved_in_favour_of_earlier_emails():
+    emails = EmailList("me@goodcorp.ai")
+    emails.add_received_email("x@example.com", "Report", "quarterly report")
+    emails.add_sent_email("y@example.com", "Report", "quarterly report")
+    emails.add_received_email("x@example.com", "Report", "quarterly report")
+    found, total = emails.scored_search("report", top_k=3, ranking="bm25")
+    assert total == 3
+    assert len({score for score, *_ in found}) == 1
+    assert [key for _, key, *_ in found] == [(SENT, 0), (RECEIVED, 0), (RECEIVED, 1)]
+
+
+def test_bm25_postings_share_term_frequencies():
+    index = search_index.BM25Index()
+    for position in range(2):
+        index.add((RECEIVED, position), {"from": "a@example.com", "subject": "hello", "body": "hello world"})
+    assert index.postings["hello"][(RECEIVED, 0)] is index.postings["hello"][(RECEIVED, 1)]
+
+
+def test_bm25_index_is_built_on_first_bm25_search():
+    emails = EmailList("me@goodcorp.ai")
+    emails.add_received_email("alice@goodcorp.ai", "Invoice", "invoice for march")
+    emails.keyword_search("invoice")
+    assert emails.bm25_index is None
+
+    assert len(emails.keyword_search("invoice", ranking="bm25")) == 1
+    emails.add_sent_email("bob@goodcorp.ai", "Invoice", "invoice for april")
+    assert len(emails.bm25_index.doc_lengths) == 2
+    assert [email["body"] for email in emails.keyword_search("april invoice", ranking="bm25")] == ["invoice for april", "invoice for march"]
@@ -0,0 +1,60 @@
+from models.email_list import EmailList, RECEIVED, SENT
+from models.semantic_index import HashingEmbedder, SemanticIndex
+import pytest
+
+np = pytest.importorskip("numpy")
+
+
+def make_email_list(storage: str = "list") -> EmailList:
+    email_list = EmailList("me@goodcorp.ai", storage=storage)
+    email_list.add_received_email("alice@goodcorp.ai", "Invoices", "The invoices for March are attached")
+    email_list.add_received_email("bob@goodcorp.ai", "Lunch", "Pizza or sushi on Friday?")
+    email_list.add_received_email("carol@goodcorp.ai", "Holidays", "The office is closed during the holidays")
+    return email_list
+
+
+def test_hashing_embedder_returns_unit_vectors():
+    vectors = HashingEmbedder(dim=64).embed(["invoice", "Invoice", ""])
+    assert vectors.shape == (3, 64)
+    assert np.allclose(np.linalg.norm(vectors[:2], axis=1), 1.0)
+    assert np.allclose(vectors[0], vectors[1])
+    assert not vectors[2].any()
+
+
+@pytest.mark.parametrize("storage", ["list", "compact"])
+def test_semantic_search_finds_other_forms_of_words(storage):
+    email_list = make_email_list(storage)
+    # Keyword search does not find "invoices" by "invoicing", semantic search finds it by shared trigrams.
+    assert email_list.keyword_search("invoicing") == []
+    found = email_list.keyword_search("invoicing", top_k=1, ranking="semantic")
+    assert [email["subject"] for email in found] == ["Invoices"]
+
+
+def test_semantic_index_is_updated_on_insert():
+    email_list = make_email_list()
+    email_list.keyword_search("lunch", ranking="semantic")
+    email_list.add_sent_email("dave@goodcorp.ai", "Team lunch", "Lunch is booked for the whole team")
+
+    results, total = email_list.search_with_verdicts("team lunch", top_k=2, ranking="semantic")
+    assert [email["subject"] for email, _ in results] == ["Team lunch", "Lunch"]
+    assert len(email_list.semantic_index) == 4
+
+
+def test_hybrid_search_boosts_keyword_matches():
+    email_list = EmailList("me@goodcorp.ai")
+    email_list.add_received_email("alice@goodcorp.ai", "Invoicing", "invoicing")
+    email_list.add_received_email("bob@goodcorp.ai", "Misc", "the invoice and some notes")
+    assert [email["subject"] for email in email_list.keyword_search("invoice", ranking="semantic")] == ["Invoicing", "Misc"]
+    assert [email["subject"] for email in email_list.keyword_search("invoice", ranking="hybrid")] == ["Misc", "Invoicing"]
+
+
+def test_semantic_search_pages():
+    index = SemanticIndex(HashingEmbedder(dim=256), initial_capacity=2)
+    keys = [(SENT, 0), (RECEIVED, 0), (RECEIVED, 1)]
+    index.add_many(keys, ["report", "report", "weekly report"])
+    first, total = index.search("report", top_k=2)
+    second, _ = index.search("report", top_k=2, offset=2)
+    assert total == 3
+    # Equally similar emails are ordered by their keys, the matrix grew past its initial capacity.
+    assert first == [(SENT, 0), (RECEIVED, 0)]
+    assert second == [(RECEIVED, 1)]
@@ -0,0 +1,85 @@
+from models.search_index import BM25Index, InvertedIndex, TOKEN_PATTERN, merge_collection_stats
+from models.sharded_registry import ShardedEmailRegistry, _shard_collection_stats, _shard_search
+import pytest
+
+
+MAILBOXES = {
+    "alice@goodcorp.ai": [
+        {"from": "bob@goodcorp.ai", "subject": "Invoice", "body": "invoice for march"},
+        {"from": "carol@goodcorp.ai", "subject": "Lunch", "body": "lunch on friday, bring the invoice"},
+    ],
+    "bob@goodcorp.ai": [
+        {"from": "dave@goodcorp.ai", "subject": "Invoice", "body": "invoice for march"},
+        {"from": "erin@goodcorp.ai", "subject": "Report", "body": "quarterly report " + "filler " * 50},
+    ],
+    "carol@goodcorp.ai": [
+        {"from": "frank@goodcorp.ai", "subject": "Report", "body": "report report invoice"},
+    ],
+    "dave@goodcorp.ai": [
+        {"from": "grace@goodcorp.ai", "subject": "Invoice", "body": "invoice for march"},
+        {"from": "heidi@goodcorp.ai", "subject": "Holidays", "body": "the office is closed"},
+    ],
+}
+
+
+@pytest.fixture(scope="module")
+def registry():
+    with ShardedEmailRegistry(shards=2) as registry:
+        registry.load_mailboxes(MAILBOXES)
+        assert all(registry.addresses)
+        yield registry
+
+
+def single_index_search(query: str, top_k: int, ranking: str):
+    """(score, address, email) of the best emails, as if all mailboxes were one collection searched in this process"""
+    index = BM25Index() if ranking == "bm25" else InvertedIndex()
+    addresses = sorted(MAILBOXES)
+    for i, address in enumerate(addresses):
+        for position, email in enumerate(MAILBOXES[address]):
+            index.add((i, position), email)
+    scores = index.score(TOKEN_PATTERN.findall(query.lower()))
+    best = sorted(scores.items(), key=lambda item: (-item[1], addresses[item[0][0]], item[0][1]))[:top_k]
+    return [(score, addresses[i], MAILBOXES[addresses[i]][position]) for (i, position), score in best], len(scores)
+
+
+def sharded_hits(registry: ShardedEmailRegistry, query: str, top_k: int, ranking: str):
+    """Hits of every shard with their scores, searched the way `ShardedEmailRegistry.search` does it"""
+    collection = None
+    if ranking == "bm25":
+        collection = merge_collection_stats(shard.submit(_shard_collection_stats, query, None).result() for shard in registry.shards)
+    hits = []
+    for shard in registry.shards:
+        shard_hits, _ = shard.submit(_shard_search, query, top_k, ranking, None, collection).result()
+        hits.extend(shard_hits)
+    return {(address, key[1]): score for score, address, key, _, _ in hits}
+
+
+@pytest.mark.parametrize("ranking", ["count", "bm25"])
+@pytest.mark.parametrize("query", ["invoice", "march invoice", "report", "closed office lunch"])
+def test_sharded_search_matches_single_collection(registry, ranking, query):
+    expected, expected_total = single_index_search(query, 4, ranking)
+
+    found, total = registry.search(query, top_k=4, ranking=ranking)
+    assert total == expected_total
+    # Received emails get the mailbox address as their "to".
+    assert [(address, {**expected_email, "to": address}) for _, address, expected_email in expected] == [
+        (address, email) for address, email, _ in found
+    ]
+
+    scores = sharded_hits(registry, query, 4, ranking)
+    for score, address, email in expected:
+        position = MAILBOXES[address].index(email)
+        assert scores[(address, position)] == pytest.approx(score)
+
+
+def test_ties_are_resolved_by_address(registry):
+    found, _ = registry.search("march", top_k=3, ranking="bm25")
+    # Equal emails of three mailboxes have equal scores.
+    assert [address for address, _, _ in found] == ["alice@goodcorp.ai", "bob@goodcorp.ai", "dave@goodcorp.ai"]
+    found, _ = registry.search("march", top_k=2, ranking="bm25", addresses=["dave@goodcorp.ai", "bob@goodcorp.ai"])
+    assert [address for address, _, _ in found] == ["bob@goodcorp.ai", "dave@goodcorp.ai"]
+
+
+def test_semantic_ranking_is_rejected(registry):
+    with pytest.raises(ValueError):
+        registry.search("invoice", ranking="semantic")
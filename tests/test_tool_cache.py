@@ -0,0 +1,55 @@
+from models.behavior_certificates import DummyEmailBehaviorCertificates
+from models.email_agent_tools import EmailRegistry, FindEmailsTool
+from models.email_list import EmailList
+from models.tool_cache import ToolResultCache, normalize_query
+
+
+USER = "me@goodcorp.ai"
+
+
+def make_tool(cache: ToolResultCache) -> FindEmailsTool:
+    email_list = EmailList(USER)
+    email_list.add_received_email("alice@goodcorp.ai", "Invoice", "invoice for march")
+    return FindEmailsTool(USER, EmailRegistry({USER: email_list}), DummyEmailBehaviorCertificates(), cache=cache)
+
+
+def test_normalize_query():
+    assert normalize_query("March invoice") == normalize_query("invoice, MARCH")
+    assert normalize_query("All emails") == normalize_query("all")
+    assert normalize_query("all emails") != normalize_query("emails all")
+
+
+def test_semantic_queries_keep_word_order():
+    for ranking in ("semantic", "hybrid"):
+        assert normalize_query("invoice  from\tbob", ranking) == "invoice from bob"
+        assert normalize_query("invoice from bob", ranking) != normalize_query("bob from invoice", ranking)
+        assert normalize_query("All emails", ranking) == normalize_query("all", "count")
+    assert normalize_query("invoice from bob", "bm25") == normalize_query("bob from invoice", "bm25")
+
+
+def test_equivalent_queries_share_cached_output():
+    cache = ToolResultCache()
+    tool = make_tool(cache)
+    output = tool.forward("march invoice")
+    assert tool.forward("Invoice March") == output
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_ratio": 0.5, "size": 1}
+
+
+def test_cached_output_is_invalidated_when_email_is_added():
+    cache = ToolResultCache()
+    tool = make_tool(cache)
+    assert "Found 1 email(s)" in tool.forward("invoice")
+
+    tool.email_registry[USER].add_received_email("bob@goodcorp.ai", "Invoice", "invoice for april")
+    assert "Found 2 email(s)" in tool.forward("invoice")
+    assert cache.stats()["hits"] == 0
+
+
+def test_cache_is_bounded():
+    cache = ToolResultCache(max_size=2)
+    for key in ["a", "b", "a", "c"]:
+        if cache.get(key, 1) is None:
+            cache.put(key, 1, key.upper())
+    assert cache.get("a", 1) == "A"
+    assert cache.get("b", 1) is None
+    assert cache.get("c", 2) is None
@@ -1,17 +1,49 @@
+from typing import Dict
 import gradio as gr
 
 from models.email_agent_tools import EmailRegistry
-from ui.formatters import format_emails_list
+from models.email_list import RECEIVED, SENT
+from services.metrics import metrics
+from ui.formatters import emails_render_cache
 
 
-def get_received_emails(addr: str, email_registry: EmailRegistry):
-    """Get all received emails for the addr"""
-    return format_emails_list(email_registry[addr].get_received_emails())
+# Number of emails on a page of a mailbox panel, only the visible page is sent to the browser.
+EMAILS_PAGE_SIZE = 20
 
 
-def get_sent_emails(addr: str, email_registry: EmailRegistry):
-    """Get all sent emails from the addr"""
-    return format_emails_list(email_registry[addr].get_sent_emails())
+@metrics.timed("render_emails_page")
+def get_emails_page(addr: str, box: int, email_registry: EmailRegistry, page: int = 1):
+    """Get a page of sent or received emails of the addr and number of the page (it is the last one if out of range)"""
+    return emails_render_cache.render_page(email_registry[addr], box, max(int(page or 1), 1), EMAILS_PAGE_SIZE)
+
+
+def get_emails_update(addr: str, box: int, email_registry: EmailRegistry, page: int = 1, shown_versions: Dict | None = None):
+    """
+    Get a page of sent or received emails of the addr for a panel and number of the page for its page field
+
+    The page number is the last page, if the requested one is out of range, so the field shows the rendered page.
+    shown_versions keeps (list version, page) shown by every panel of a browser session,
+    if the panel already shows this page of the same list, no-op updates are returned instead.
+    """
+    page = max(int(page or 1), 1)
+    version = email_registry[addr].box_version(box)
+    if shown_versions is not None and shown_versions.get((addr, box)) == (version, page):
+        return gr.update(), gr.update()
+
+    output, page = get_emails_page(addr, box, email_registry, page)
+    if shown_versions is not None:
+        shown_versions[(addr, box)] = (version, page)
+    return output, page
+
+
+def get_received_emails(addr: str, email_registry: EmailRegistry, page: int = 1, shown_versions: Dict | None = None):
+    """Get a page of received emails for the addr and its number"""
+    return get_emails_update(addr, RECEIVED, email_registry, page, shown_versions)
+
+
+def get_sent_emails(addr: str, email_registry: EmailRegistry, page: int = 1, shown_versions: Dict | None = None):
+    """Get a page of sent emails from the addr and its number"""
+    return get_emails_update(addr, SENT, email_registry, page, shown_versions)
 
 
 def send_email(
@@ -20,24 +52,44 @@ def send_email(
         subject: str, 
         body: str,
         email_registry: EmailRegistry,
+        received_page: int = 1,
+        sent_page: int = 1,
+        shown_versions: Dict | None = None,
 ):
-    """Send email from from_addr to to_addr"""
+    """Send email from from_addr to to_addr, returns status and (page, page number) of both mailbox panels"""
     if not subject or not body:
-        return "Error: Subject and body are required", get_received_emails(to_addr, email_registry), get_sent_emails(from_addr, email_registry)
+        return (
+            "Error: Subject and body are required",
+            *get_received_emails(to_addr, email_registry, received_page, shown_versions),
+            *get_sent_emails(from_addr, email_registry, sent_page, shown_versions),
+        )
         
     email_registry[from_addr].add_sent_email(to_addr, subject, body)
     email_registry[to_addr].add_received_email(from_addr, subject, body)
 
-    return "✅ Email sent successfully!", get_received_emails(to_addr, email_registry), get_sent_emails(from_addr, email_registry)
+    return (
+        "✅ Email sent successfully!",
+        *get_received_emails(to_addr, email_registry, received_page, shown_versions),
+        *get_sent_emails(from_addr, email_registry, sent_page, shown_versions),
+    )
 
 
-def refresh_emails(user_addr: str, attacker_addr: str, email_registry: EmailRegistry):
-    """Refresh all email displays"""
+def refresh_emails(
+        user_addr: str,
+        attacker_addr: str,
+        email_registry: EmailRegistry,
+        received_page: int = 1,
+        sent_page: int = 1,
+        attacker_sent_page: int = 1,
+        attacker_received_page: int = 1,
+        shown_versions: Dict | None = None,
+):
+    """Refresh email displays (with their page numbers), which have changed (all of them, if shown_versions is not given)"""
     return (
-        get_received_emails(user_addr, email_registry), 
-        get_sent_emails(user_addr, email_registry), 
-        get_sent_emails(attacker_addr, email_registry),
-        get_received_emails(attacker_addr, email_registry),
+        *get_received_emails(user_addr, email_registry, received_page, shown_versions), 
+        *get_sent_emails(user_addr, email_registry, sent_page, shown_versions), 
+        *get_sent_emails(attacker_addr, email_registry, attacker_sent_page, shown_versions),
+        *get_received_emails(attacker_addr, email_registry, attacker_received_page, shown_versions),
     )
 
 
@@ -47,8 +99,16 @@ def get_interface(
         email_registry: EmailRegistry,
         chat_with_agent_fn,
         reset_agent_fn,
+        close_session_fn=None,
+        stream: bool = False,
+        refresh_interval: float = 0,
 ):
-    """Get Gradio interface for email agent demo"""
+    """
+    Get Gradio interface for email agent demo
+
+    If stream is enabled, chat_with_agent_fn must yield (response, logs) pairs instead of returning one pair.
+    If refresh_interval (in seconds) is set, mailbox panels are refreshed by timer, but only when their emails change.
+    """
 
     # Custom CSS for toggle switch and visual changes
     custom_css = """
@@ -170,6 +230,29 @@ def get_interface(
         # A2AS Protection State
         a2as_enabled = gr.State(False)
 
+        # (list version, page) shown by every mailbox panel of the session, unchanged panels are not sent again
+        shown_versions = gr.State({})
+
+        def mailbox_panel(addr: str, box: int, elem_classes: str):
+            """Paginated view of sent or received emails, returns its display and page number"""
+            display = gr.Markdown(
+                value=get_emails_page(addr, box, email_registry)[0],
+                elem_classes=elem_classes,
+                max_height="400px"
+            )
+            with gr.Row():
+                prev_btn = gr.Button("◀", size="sm", min_width=40)
+                page = gr.Number(value=1, precision=0, minimum=1, show_label=False, container=False, min_width=60)
+                next_btn = gr.Button("▶", size="sm", min_width=40)
+
+            def show_page(page_number, delta=0):
+                return get_emails_page(addr, box, email_registry, int(page_number or 1) + delta)
+
+            prev_btn.click(lambda page_number: show_page(page_number, -1), [page], [display, page])
+            next_btn.click(lambda page_number: show_page(page_number, 1), [page], [display, page])
+            page.submit(show_page, [page], [display, page])
+            return display, page
+
         with gr.Row():
             # Left Column: User Emails
             with gr.Column(scale=1):
@@ -177,18 +260,10 @@ def get_interface(
                 gr.Markdown(f"**Email:** `{user_addr}`")
 
                 gr.Markdown("### Received emails")
-                received_display = gr.Markdown(
-                    value=get_received_emails(user_addr, email_registry),
-                    elem_classes="email-list",
-                    max_height="400px"
-                )
+                received_display, received_page = mailbox_panel(user_addr, RECEIVED, "email-list")
 
                 gr.Markdown("### Sent emails")
-                sent_display = gr.Markdown(
-                    value=get_sent_emails(user_addr, email_registry),
-                    elem_classes="email-list-sent",
-                    max_height="400px"
-                )
+                sent_display, sent_page = mailbox_panel(user_addr, SENT, "email-list-sent")
 
                 refresh_btn = gr.Button("🔄 Refresh emails", variant="secondary")
 
@@ -258,18 +333,10 @@ def get_interface(
                 attacker_status = gr.Markdown("")
 
                 gr.Markdown("### Hacker's sent emails")
-                attacker_sent_display = gr.Markdown(
-                    value=get_sent_emails(attacker_addr, email_registry),
-                    elem_classes="email-list",
-                    max_height="400px"
-                )
+                attacker_sent_display, attacker_sent_page = mailbox_panel(attacker_addr, SENT, "email-list")
 
                 gr.Markdown("### Hacker's received emails")
-                attacker_received_display = gr.Markdown(
-                    value=get_received_emails(attacker_addr, email_registry),
-                    elem_classes="email-list",
-                    max_height="400px"
-                )
+                attacker_received_display, attacker_received_page = mailbox_panel(attacker_addr, RECEIVED, "email-list")
 
         # Event handlers
         def toggle_a2as_state(toggle_value):
@@ -282,26 +349,54 @@ def get_interface(
             history.append({"role": "user", "content": message})
             return "", history
 
-        def bot_respond(history, a2as_enabled_state):
+        def bot_respond(
+                history,
+                a2as_enabled_state,
+                received_page_number,
+                sent_page_number,
+                attacker_received_page_number,
+                shown,
+                request: gr.Request,
+        ):
             if not history or history[-1]["role"] != "user":
-                return history, get_received_emails(user_addr, email_registry), \
-                    get_sent_emails(user_addr, email_registry), \
-                    get_received_emails(attacker_addr, email_registry), ""
+                yield history, *get_received_emails(user_addr, email_registry, received_page_number, shown), \
+                    *get_sent_emails(user_addr, email_registry, sent_page_number, shown), \
+                    *get_received_emails(attacker_addr, email_registry, attacker_received_page_number, shown), "", shown
+                return
 
             user_message = history[-1]["content"]
 
-            bot_response, logs = chat_with_agent_fn(user_message, a2as_enabled=a2as_enabled_state)
-
-            history.append({"role": "assistant", "content": bot_response})
-
-            return (
+            responses = chat_with_agent_fn(
+                user_message,
+                a2as_enabled=a2as_enabled_state,
+                session_id=request.session_hash,
+            )
+            if not stream:
+                responses = [responses]
+
+            history.append({"role": "assistant", "content": ""})
+            logs = ""
+            for bot_response, logs in responses:
+                # Mailboxes are refreshed only once, when the agent finishes.
+                history[-1]["content"] = bot_response
+                yield history, *[gr.update()] * 6, logs, shown
+
+            # Only mailboxes changed by the agent are sent to the browser.
+            yield (
                 history,
-                get_received_emails(user_addr, email_registry),
-                get_sent_emails(user_addr, email_registry),
-                get_received_emails(attacker_addr, email_registry),
-                logs
+                *get_received_emails(user_addr, email_registry, received_page_number, shown),
+                *get_sent_emails(user_addr, email_registry, sent_page_number, shown),
+                *get_received_emails(attacker_addr, email_registry, attacker_received_page_number, shown),
+                logs,
+                shown,
             )
 
+        def reset_session_agent(request: gr.Request):
+            reset_agent_fn(request.session_hash)
+
+        def close_session(request: gr.Request):
+            close_session_fn(request.session_hash)
+
         # Toggle A2AS state and apply visual changes
         a2as_toggle.change(
             toggle_a2as_state,
@@ -329,8 +424,9 @@ def get_interface(
             [msg, chatbot]
         ).then(
             bot_respond,
-            [chatbot, a2as_enabled],
-            [chatbot, received_display, sent_display, attacker_received_display, agent_logs]
+            [chatbot, a2as_enabled, received_page, sent_page, attacker_received_page, shown_versions],
+            [chatbot, received_display, received_page, sent_display, sent_page, attacker_received_display, attacker_received_page,
+             agent_logs, shown_versions]
         )
 
         submit_btn.click(
@@ -339,8 +435,9 @@ def get_interface(
             [msg, chatbot]
         ).then(
             bot_respond,
-            [chatbot, a2as_enabled],
-            [chatbot, received_display, sent_display, attacker_received_display, agent_logs]
+            [chatbot, a2as_enabled, received_page, sent_page, attacker_received_page, shown_versions],
+            [chatbot, received_display, received_page, sent_display, sent_page, attacker_received_display, attacker_received_page,
+             agent_logs, shown_versions]
         )
 
         clear_btn.click(
@@ -348,29 +445,57 @@ def get_interface(
             inputs=None,
             outputs=[chatbot, agent_logs],
         ).then(
-            fn=reset_agent_fn,
+            fn=reset_session_agent,
             inputs=None,
             outputs=None,
         )
 
         # Attacker email sending
         attacker_send_btn.click(
-            lambda subject, body: send_email(attacker_addr, user_addr, subject, body, email_registry),
-            [attacker_subject, attacker_body],
-            [attacker_status, received_display, attacker_sent_display]
+            lambda subject, body, received_page_number, attacker_sent_page_number, shown: (*send_email(
+                attacker_addr, user_addr, subject, body, email_registry, received_page_number, attacker_sent_page_number, shown,
+            ), shown),
+            [attacker_subject, attacker_body, received_page, attacker_sent_page, shown_versions],
+            [attacker_status, received_display, received_page, attacker_sent_display, attacker_sent_page, shown_versions]
         )
 
+        mailbox_pages = [received_page, sent_page, attacker_sent_page, attacker_received_page]
+        # Every display is followed by its page number, which is corrected if the page is out of range.
+        mailbox_displays = [
+            received_display, received_page,
+            sent_display, sent_page,
+            attacker_sent_display, attacker_sent_page,
+            attacker_received_display, attacker_received_page,
+        ]
+
+        def refresh_changed_emails(*page_numbers_and_shown):
+            *page_numbers, shown = page_numbers_and_shown
+            return (*refresh_emails(user_addr, attacker_addr, email_registry, *page_numbers, shown), shown)
+
         # Refresh button
         refresh_btn.click(
-            lambda: refresh_emails(user_addr, attacker_addr, email_registry),
-            None,
-            [received_display, sent_display, attacker_sent_display, attacker_received_display]
+            refresh_changed_emails,
+            [*mailbox_pages, shown_versions],
+            [*mailbox_displays, shown_versions]
         )
 
         demo.load(
-            lambda: refresh_emails(user_addr, attacker_addr, email_registry),
-            None,
-            [received_display, sent_display, attacker_sent_display, attacker_received_display]
+            refresh_changed_emails,
+            [*mailbox_pages, shown_versions],
+            [*mailbox_displays, shown_versions]
         )
 
+        # Push emails sent by others (e.g. other sessions) to the browser, only when they change
+        if refresh_interval:
+            gr.Timer(refresh_interval).tick(
+                refresh_changed_emails,
+                [*mailbox_pages, shown_versions],
+                [*mailbox_displays, shown_versions],
+                show_progress="hidden",
+            )
+
+        # Free agents of the session, when user closes the page
+        if close_session_fn is not None:
+            demo.unload(close_session)
+
     return demo
\ No newline at end of file
@@ -1,34 +1,97 @@
+from typing import Dict, Mapping, Tuple
+import math
+import threading
+import weakref
+
+
+# Newlines are replaced with spaces, special Markdown characters are escaped with a backslash.
+MARKDOWN_ESCAPES = str.maketrans(
+    {'\n': ' ', **{char: '\\' + char for char in '\\`*_{}[]()#+-.!|'}}
+)
+
+
+def escape_markdown(text):
+    """Escape special Markdown characters and newlines"""
+    if not text:
+        return text
+    return text.translate(MARKDOWN_ESCAPES)
+
+
+def format_email(i: int, email: Mapping[str, str]) -> str:
+    """Format a single email of the list, i is its number starting from 1"""
+    from_addr = escape_markdown(email.get('from', 'N/A'))
+    to_addr = escape_markdown(email.get('to', 'N/A'))
+    subject = escape_markdown(email.get('subject', 'N/A'))
+    body = escape_markdown(email.get('body', ''))
+
+    return (f"**[Email {i}]**<br>"
+            f"&nbsp;&nbsp;&nbsp;&nbsp;From:&nbsp;&nbsp;&nbsp;&nbsp; {from_addr}<br>"
+            f"&nbsp;&nbsp;&nbsp;&nbsp;To:&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp; {to_addr}<br>"
+            f"&nbsp;&nbsp;&nbsp;&nbsp;Subject: {subject}<br>"
+            f"<div style='max-height: 75px; overflow: overlay;'>&nbsp;&nbsp;&nbsp;&nbsp;Body:&nbsp;&nbsp;&nbsp;&nbsp; {body}</div><br>"
+            f"{'─' * 50}")
+
+
 def format_emails_list(emails):
     """Format emails for display"""
     if not emails:
         return "No emails"
-    
-    def escape_markdown(text):
-        """Escape special Markdown characters and newlines"""
-        if not text:
-            return text
 
-        text = text.replace('\n', ' ')
+    return "\n\n".join(format_email(i, email) for i, email in enumerate(emails, 1))
 
-        special_chars = ['\\', '`', '*', '_', '{', '}', '[', ']', '(', ')', '#', '+', '-', '.', '!', '|']
-        for char in special_chars:
-            text = text.replace(char, '\\' + char)
-        return text
-    
-    result = []
-    for i, email in enumerate(emails, 1):
-        body = email.get('body', '')
-
-        from_addr = escape_markdown(email.get('from', 'N/A'))
-        to_addr = escape_markdown(email.get('to', 'N/A'))
-        subject = escape_markdown(email.get('subject', 'N/A'))
-        body = escape_markdown(body)
-        
-        result.append(f"**[Email {i}]**<br>"
-                     f"&nbsp;&nbsp;&nbsp;&nbsp;From:&nbsp;&nbsp;&nbsp;&nbsp; {from_addr}<br>"
-                     f"&nbsp;&nbsp;&nbsp;&nbsp;To:&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;&nbsp; {to_addr}<br>"
-                     f"&nbsp;&nbsp;&nbsp;&nbsp;Subject: {subject}<br>"
-                     f"<div style='max-height: 75px; overflow: overlay;'>&nbsp;&nbsp;&nbsp;&nbsp;Body:&nbsp;&nbsp;&nbsp;&nbsp; {body}</div><br>"
-                     f"{'─' * 50}")
-    
-    return "\n\n".join(result)
\ No newline at end of file
+
+class EmailsRenderCache:
+    """
+    Renders pages of email lists, remembering every rendered email.
+
+    A page is re-rendered only if its email list has changed (got a new version) since the last render,
+    and then only emails, which are not the ones rendered before at their positions, are formatted again.
+    Positions are not enough to identify emails: a rolled back snapshot gets different emails at the same positions.
+    """
+
+    def __init__(self):
+        # email list -> {(box, position): (email, rendered email)}, entries disappear together with email lists.
+        self._fragments: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        # email list -> {box: (version, page, page size, rendered page)}, last rendered page of every box.
+        self._pages: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def render_page(self, email_list, box: int, page: int, page_size: int) -> Tuple[str, int]:
+        """Render a page (starting from 1) of sent or received emails, returns it with its number, which is the last page if out of range"""
+        with self._lock:
+            pages: Dict[int, Tuple[int, int, int, str]] = self._pages.setdefault(email_list, {})
+            fragments: Dict[Tuple[int, int], Tuple[Mapping[str, str], str]] = self._fragments.setdefault(email_list, {})
+
+            version = email_list.version
+            cached = pages.get(box)
+            if cached is not None and cached[:3] == (version, page, page_size):
+                return cached[3], page
+
+            emails, total = email_list.get_emails_page(box, (page - 1) * page_size, page_size)
+            if not emails and total:
+                # Page is out of range, the last page is shown instead.
+                page = math.ceil(total / page_size)
+                emails, total = email_list.get_emails_page(box, (page - 1) * page_size, page_size)
+
+            if not emails:
+                output = "No emails"
+            else:
+                offset = (page - 1) * page_size
+                parts = [f"*Page {page} of {math.ceil(total / page_size)}, {total} email(s)*"]
+                for position, email in enumerate(emails, offset):
+                    cached_fragment = fragments.get((box, position))
+                    # Storages, which build emails on every read, return equal emails instead of the same ones.
+                    if cached_fragment is not None and (cached_fragment[0] is email or cached_fragment[0] == email):
+                        fragment = cached_fragment[1]
+                    else:
+                        fragment = format_email(position + 1, email)
+                        fragments[(box, position)] = (email, fragment)
+                    parts.append(fragment)
+                output = "\n\n".join(parts)
+
+            pages[box] = (version, page, page_size, output)
+            return output, page
+
+
+# Cache used by the mailbox panels of the interface.
+emails_render_cache = EmailsRenderCache()
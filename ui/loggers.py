@@ -1,12 +1,51 @@
-import re
+from collections import deque
 import sys
-import io
+import threading
 
-class GradioConsoleLogger(io.StringIO):
-    def __init__(self):
-        super().__init__()
-        self.terminal = sys.stdout
 
-    def write(self, message):
-        self.terminal.write(message)
-        super().write(message)
\ No newline at end of file
+class GradioConsoleLogger:
+    """
+    Text sink for the agent's console, which keeps only the last max_chars characters.
+
+    Logs of a session are shown in the UI after every agent step, so their size (and the cost of sending them)
+    must not grow with the length of the conversation. Writes are copied to the terminal, if tee is enabled.
+    """
+
+    def __init__(self, max_chars: int = 100_000, tee: bool = True):
+        if max_chars <= 0:
+            raise ValueError(f"max_chars must be positive, got {max_chars}")
+        self.max_chars = max_chars
+        self.terminal = sys.stdout if tee else None
+        self._chunks = deque()
+        self._size = 0
+        # Joined chunks, kept until the next write.
+        self._value: str | None = ""
+        self._lock = threading.Lock()
+
+    def write(self, message: str) -> int:
+        if self.terminal is not None:
+            self.terminal.write(message)
+        with self._lock:
+            self._chunks.append(message)
+            self._size += len(message)
+            # Chunks, which are entirely out of the last max_chars characters, are dropped.
+            while self._size - len(self._chunks[0]) >= self.max_chars:
+                self._size -= len(self._chunks.popleft())
+            self._value = None
+        return len(message)
+
+    def flush(self):
+        if self.terminal is not None:
+            self.terminal.flush()
+
+    def getvalue(self) -> str:
+        with self._lock:
+            if self._value is None:
+                self._value = "".join(self._chunks)[-self.max_chars:]
+            return self._value
+
+    def clear(self):
+        with self._lock:
+            self._chunks.clear()
+            self._size = 0
+            self._value = ""